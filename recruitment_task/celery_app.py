@@ -16,9 +16,20 @@ app.conf.beat_schedule = {
     "task_get_meteo_warnings_every_minute": {
         "task": "satagro.tasks.get_meteo_warnings",
         "schedule": 60.0,
+        # runs waiting in queue for longer than an interval are dropped, next one is already scheduled
+        "options": {"expires": 55},
+    },
+    "task_archive_due_meteo_warnings_every_15_seconds": {
+        "task": "satagro.tasks.archive_due_meteo_warnings",
+        "schedule": 15.0,
+        "options": {"expires": 15},
     },
     "task_move_old_meteo_warnings_to_archive_every_hour": {
         "task": "satagro.tasks.move_old_meteo_warnings_to_archive",
         'schedule': crontab(minute=1, hour='*'),
     },
-}
\ No newline at end of file
+    "task_create_meteo_warning_archive_partitions_every_day": {
+        "task": "satagro.tasks.create_meteo_warning_archive_partitions",
+        "schedule": crontab(minute=30, hour=3),
+    },
+}
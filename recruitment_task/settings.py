@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'rest_framework',
     'satagro'
 ]
@@ -87,6 +88,99 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://satagro_redis:6379/1',
+    }
+}
+
+# In-process district lookup index (satagro.district_index).
+# Index is built once per process and rebuilt when generate_districts changes districts table,
+# version of the table is checked at most once per DISTRICT_INDEX_CHECK_INTERVAL seconds.
+DISTRICT_INDEX_ENABLED = False
+DISTRICT_INDEX_CHECK_INTERVAL = 30
+
+# Cache of serialized responses keyed by district and warnings generation (satagro.cache).
+# Coordinates are rounded to POINT_CACHE_PRECISION decimal places (5 places is about 1 meter)
+# before remembering which district they belong to. Every distinct point is a key in Redis shared with
+# celery broker, so entries expire after POINT_CACHE_TIMEOUT and points out of bounds much sooner.
+# Responses of previous generations are left behind, so they expire after METEO_WARNINGS_CACHE_TIMEOUT at the latest.
+METEO_WARNINGS_CACHE_ENABLED = True
+METEO_WARNINGS_CACHE_TIMEOUT = 60 * 60
+POINT_CACHE_PRECISION = 5
+POINT_CACHE_TIMEOUT = 60 * 60
+POINT_CACHE_MISS_TIMEOUT = 60
+
+# Serve ready to send district documents materialized by sync and archive tasks (satagro.snapshots)
+DISTRICT_SNAPSHOTS_ENABLED = True
+
+# Cache-Control max-age of /api/meteo_warnings/ responses, warnings are synchronized once a minute
+METEO_WARNINGS_MAX_AGE = 60
+
+# Maximum number of points accepted by /api/meteo_warnings/batch/
+METEO_WARNINGS_BATCH_MAX_POINTS = 50000
+
+# IMGW meteo warnings feed polled by get_meteo_warnings, API_REQUEST_TIMEOUT is (connect, read) in seconds
+IMGW_WARNINGS_URL = 'https://danepubliczne.imgw.pl/api/data/warningsmeteo'
+API_REQUEST_TIMEOUT = (5, 20)
+
+# Sync and archive tasks run in one worker at a time (satagro.locks), lock lease in seconds is renewed
+# while task is running and expires by itself when worker dies
+TASK_LOCKS_ENABLED = True
+TASK_LOCKS_REDIS_URL = 'redis://satagro_redis:6379/0'
+TASK_LOCK_LEASE = 60
+
+# Server-Sent Events stream of warning changes (/api/meteo_warnings/stream/), published by tasks through Redis pub/sub
+WARNINGS_EVENTS_REDIS_URL = 'redis://satagro_redis:6379/0'
+SSE_KEEPALIVE_INTERVAL = 15
+SSE_QUEUE_SIZE = 100
+SSE_MAX_DISTRICTS = 380
+
+# Vector tiles of districts (/api/tiles/{z}/{x}/{y}.mvt), geometry is simplified by TILES_SIMPLIFY_PIXELS pixels
+# of given zoom level. Cached tiles are replaced as soon as warnings of districts in a tile change.
+TILES_MAX_ZOOM = 16
+TILES_SIMPLIFY_PIXELS = 1
+TILES_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Rows fetched at once from server-side cursor by /api/meteo_warnings/export/ and export_meteo_warnings command
+EXPORT_CHUNK_SIZE = 200
+
+# Page size of /api/meteo_warnings/archive/, clients can ask for smaller or bigger pages with limit parameter
+ARCHIVE_PAGE_SIZE = 50
+ARCHIVE_MAX_PAGE_SIZE = 500
+
+# Nearest district fallback of /api/meteo_warnings/?tolerance=<meters> for points just outside of district boundaries,
+# NEAREST_DISTRICT_TOLERANCE is used for requests without tolerance (0 disables fallback)
+NEAREST_DISTRICT_TOLERANCE = 0
+NEAREST_DISTRICT_MAX_TOLERANCE = 5000
+# Number of district parts returned by KNN index scan which are compared by geodesic distance
+NEAREST_DISTRICT_CANDIDATES = 5
+
+# Views rendering responses from values() queries with orjson instead of DRF serializers and renderer,
+# output is byte-for-byte the same; remove a view name to compare both paths
+FAST_JSON_VIEWS = ["meteo_warnings", "meteo_warnings_batch"]
+
+# Number of expired warnings moved to archive in one transaction by move_old_meteo_warnings_to_archive
+ARCHIVE_CHUNK_SIZE = 1000
+
+# Archive timers (Redis sorted set of warning ids scored by valid_to) set by get_meteo_warnings and
+# handled by archive_due_meteo_warnings, hourly move_old_meteo_warnings_to_archive is only a safety net
+ARCHIVE_TIMERS_REDIS_URL = 'redis://satagro_redis:6379/0'
+
+# Number of future monthly partitions of archive tables kept ready by create_meteo_warning_archive_partitions
+ARCHIVE_PARTITIONS_MONTHS_AHEAD = 3
+
+# Number of processes reprojecting district geometries in generate_districts, None means number of CPUs
+DISTRICT_IMPORT_WORKERS = None
+
+# Maximum number of vertices of a single DistrictPart (ST_Subdivide) used for point lookups
+DISTRICT_SUBDIVIDE_MAX_VERTICES = 255
+
+# Warnings of district removed by reload_districts are linked to new districts covering at least this fraction
+# of the smaller of both areas
+DISTRICT_REMAP_MIN_OVERLAP = 0.01
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -15,12 +15,19 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path, include
 
+from satagro.api.views import metrics
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('satagro.urls')),
+    path('metrics', metrics, name='metrics'),
 
     path('api-auth/', include('rest_framework.urls'))
 ]
+
+# uvicorn does not serve static files like runserver did, with DEBUG they are served by Django
+urlpatterns += staticfiles_urlpatterns()
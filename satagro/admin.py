@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from satagro.models import District, MeteoWarning, MeteoWarningArchive
+from satagro.models import District, DistrictDataset, MeteoWarning, MeteoWarningArchive, Voivodeship
 
 admin.site.register(District)
+admin.site.register(DistrictDataset)
 admin.site.register(MeteoWarning)
-admin.site.register(MeteoWarningArchive)
\ No newline at end of file
+admin.site.register(MeteoWarningArchive)
+admin.site.register(Voivodeship)
\ No newline at end of file
@@ -0,0 +1,72 @@
+import json
+
+from django.http import HttpResponse
+from django.utils import timezone
+
+from satagro.models import District, MeteoWarning
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fields and format of MeteoWarningSerializer, builders below have to produce identical documents
+WARNING_FIELDS = ('id', 'name_of_event', 'valid_from', 'valid_to', 'published', 'content', 'comment', 'office', 'grade')
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def format_datetime(value):
+    return None if value is None else timezone.localtime(value).strftime(DATETIME_FORMAT)
+
+
+def build_warning(row):
+    """Build MeteoWarningSerializer document from values() row of district link with warning fields"""
+    return {
+        "id": row["meteowarning__id"],
+        "name_of_event": row["meteowarning__name_of_event"],
+        "valid_from": format_datetime(row["meteowarning__valid_from"]),
+        "valid_to": format_datetime(row["meteowarning__valid_to"]),
+        "published": format_datetime(row["meteowarning__published"]),
+        "content": row["meteowarning__content"],
+        "comment": row["meteowarning__comment"],
+        "office": row["meteowarning__office"],
+        "grade": row["meteowarning__grade"],
+    }
+
+
+def get_districts_data(district_codes):
+    """DistrictSerializer documents of districts with active warnings built from two values() queries,
+    returns ({district_code: data}, {district_code: earliest valid_to of its warnings})"""
+    districts = {
+        district_code: {"district_code": district_code, "name": name, "lon": None, "lat": None, "warnings": []}
+        for district_code, name in District.objects.filter(
+            district_code__in=district_codes).values_list("district_code", "name")
+    }
+    expiry = {}
+    rows = MeteoWarning.districts.through.objects.filter(
+        district_id__in=list(districts), meteowarning__valid_to__gte=timezone.now()
+    ).order_by("meteowarning__valid_from", "meteowarning__id").values(
+        "district_id", *("meteowarning__{}".format(name) for name in WARNING_FIELDS))
+    for row in rows:
+        district_code, valid_to = row["district_id"], row["meteowarning__valid_to"]
+        districts[district_code]["warnings"].append(build_warning(row))
+        if district_code not in expiry or valid_to < expiry[district_code]:
+            expiry[district_code] = valid_to
+    return districts, expiry
+
+
+def render_json(data):
+    """Render data to the same bytes as DRF JSONRenderer (compact, UTF-8, U+2028/U+2029 escaped)"""
+    if orjson is not None:
+        content = orjson.dumps(data)
+    else:
+        content = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+    return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class FastJSONResponse(HttpResponse):
+    """JSON response rendered without DRF renderer and content negotiation"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=render_json(data), **kwargs)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from satagro.models import MeteoWarning, District
+from satagro.models import MeteoWarning, District, MeteoWarningArchive
 
 
 class MeteoWarningSerializer(serializers.ModelSerializer):
@@ -11,6 +11,16 @@ class MeteoWarningSerializer(serializers.ModelSerializer):
         model = MeteoWarning
         fields = ['id', 'name_of_event', 'valid_from', 'valid_to', 'published', 'content', 'comment','office', 'grade']
 
+class MeteoWarningArchiveSerializer(serializers.ModelSerializer):
+    valid_from = serializers.DateTimeField(format="%Y-%m-%d %H:%M")
+    valid_to = serializers.DateTimeField(format="%Y-%m-%d %H:%M")
+    published = serializers.DateTimeField(format="%Y-%m-%d %H:%M")
+    districts = serializers.SlugRelatedField(slug_field="district_code", many=True, read_only=True)
+    class Meta:
+        model = MeteoWarningArchive
+        fields = ['id', 'name_of_event', 'valid_from', 'valid_to', 'published', 'content', 'comment', 'office', 'grade',
+                  'districts']
+
 class DistrictSerializer(serializers.ModelSerializer):
     warnings = MeteoWarningSerializer(source="meteowarning_set", many=True, read_only=True)
     lon = serializers.SerializerMethodField()
@@ -1,13 +1,37 @@
+import base64
+import functools
+import hashlib
+import json
+import math
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.gis.geos import Point
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
 from django.db.models import Prefetch
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.http import http_date, parse_etags
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.status import HTTP_500_INTERNAL_SERVER_ERROR
 from rest_framework.views import APIView
 
-from satagro.api.serializers import DistrictSerializer
-from satagro.models import District, MeteoWarning
+from satagro.api.rendering import FastJSONResponse, get_districts_data
+from satagro.api.serializers import DistrictSerializer, MeteoWarningArchiveSerializer, MeteoWarningSerializer
+from satagro.cache import (get_cached_district_code, get_cached_district_data,
+                           get_warnings_generation, set_cached_district_code, set_cached_district_data)
+from satagro.district_index import get_district_index, in_country_envelope
+from satagro.events import district_events
+from satagro.helpers import parse_safe_datetime
+from satagro.export import EXPORT_FORMATS, aexport_chunks, export_chunks
+from satagro.metrics import observe_stage, render_metrics
+from satagro.models import District, DistrictPart, MeteoWarning, MeteoWarningArchive, validity_range
+from satagro.snapshots import district_etag, get_district_snapshot, snapshot_data, snapshot_validators
+from satagro.tiles import get_tile, tile_is_valid
 
 
 def create_point(lon, lat):
@@ -18,18 +42,206 @@ def create_point(lon, lat):
         return None, str(e)
 
 
+def get_district_code(point: Point):
+    """Function to find code of district which contains point, without building any ORM objects.
+    Points outside of country envelope are rejected without a query, others are tested against subdivided
+    district parts, they are much cheaper to test than full district geometry."""
+    try:
+        if settings.DISTRICT_INDEX_ENABLED:
+            return get_district_index().lookup(point), None
+        if not in_country_envelope(point):
+            return None, None
+        district_code = DistrictPart.objects.filter(
+            geom__intersects=point
+        ).order_by("district_id").values_list("district_id", flat=True).first()
+        return district_code, None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_nearest_district(point: Point, tolerance):
+    """Function to find district nearest to point within tolerance (meters), returns ((district_code, distance), error).
+    Candidates come from KNN ordering (<->) on spatial index of district parts bounded by ST_DWithin in degrees,
+    then their geodesic distance is checked against tolerance."""
+    degrees = tolerance / (111320 * max(math.cos(math.radians(point.y)), 0.01))
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT district_id, ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) "
+                "AS distance FROM ("
+                "SELECT district_id, geom FROM {parts} WHERE ST_DWithin(geom, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s) "
+                "ORDER BY geom <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326) LIMIT %s) nearest "
+                "ORDER BY distance LIMIT 1".format(parts=connection.ops.quote_name(DistrictPart._meta.db_table)),
+                [point.x, point.y, point.x, point.y, degrees, point.x, point.y, settings.NEAREST_DISTRICT_CANDIDATES])
+            row = cursor.fetchone()
+    except Exception as e:
+        return None, str(e)
+    if row is None or row[1] > tolerance:
+        return None, None
+    return (row[0], row[1]), None
+
+
+def get_district_by_code(district_code):
+    """Function to get district with its active warnings"""
+    try:
+        return get_districts_with_warnings([district_code]).first(), None
+    except Exception as e:
+        return None, str(e)
+
+
 def get_district_with_warnings(point: Point):
     """Function to get all districts with warnings. valid_to__gte is optional because i have worker which runs every hour and removing old records."""
+    district_code, error = get_district_code(point)
+    if error or district_code is None:
+        return None, error
+    return get_district_by_code(district_code)
+
+
+def get_district_codes_for_points(points):
+    """Resolve list of (lon, lat) pairs to district codes with one spatial join, returns {point index: district_code}"""
+    if settings.DISTRICT_INDEX_ENABLED:
+        index = get_district_index()
+        codes = {}
+        for i, (lon, lat) in enumerate(points):
+            district_code = index.lookup(Point(lon, lat, srid=4326))
+            if district_code is not None:
+                codes[i] = district_code
+        return codes
+    inside = [i for i, (lon, lat) in enumerate(points) if in_country_envelope(Point(lon, lat, srid=4326))]
+    if not inside:
+        return {}
+    sql = """
+        SELECT DISTINCT ON (p.idx) p.idx, d.district_id
+        FROM unnest(%s::integer[], %s::double precision[], %s::double precision[]) AS p(idx, lon, lat)
+        JOIN {table} d ON ST_Intersects(d.geom, ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326))
+        ORDER BY p.idx, d.district_id
+    """.format(table=connection.ops.quote_name(DistrictPart._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [inside,
+                             [points[i][0] for i in inside],
+                             [points[i][1] for i in inside]])
+        return dict(cursor.fetchall())
+
+
+def get_districts_with_warnings(district_codes):
+    """Function to get districts with their active warnings, warnings are fetched once for all districts"""
+    return District.objects.defer("geom").filter(district_code__in=district_codes).prefetch_related(
+        Prefetch("meteowarning_set",
+                 queryset=MeteoWarning.objects.filter(valid_to__gte=timezone.now()).order_by("valid_from", "id"))
+    )
+
+
+def with_coordinates(data, lon, lat):
+    """Copy of serialized district with coordinates from current request"""
+    data = dict(data)
+    data["lon"] = lon
+    data["lat"] = lat
+    return data
+
+
+def first_warning_expiry(district):
+    """Return the earliest valid_to of prefetched district warnings"""
+    valid_to = [warning.valid_to for warning in district.meteowarning_set.all() if warning.valid_to]
+    return min(valid_to) if valid_to else None
+
+
+def district_validators(district_code):
+    """ETag and Last-Modified (newest published) of district response from one query over ids and times of its
+    active warnings, so conditional requests are answered before warnings are fetched and serialized"""
+    rows = MeteoWarning.districts.through.objects.filter(
+        district_id=district_code, meteowarning__valid_to__gte=timezone.now()
+    ).order_by("meteowarning_id").values_list(
+        "meteowarning_id", "meteowarning__published", "meteowarning__valid_from", "meteowarning__valid_to")
+    versions = ",".join("{}:{}:{}:{}".format(*(value.timestamp() if hasattr(value, "timestamp") else value
+                                               for value in row)) for row in rows)
+    digest = hashlib.sha1("{}|{}".format(district_code, versions).encode()).hexdigest()
+    published = [row[1] for row in rows if row[1] is not None]
+    return '"{}"'.format(digest), max(published) if published else None
+
+
+def etag_matches(request, etag):
+    """Check If-None-Match header of request against ETag"""
+    etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    return "*" in etags or etag in etags
+
+
+def with_validators(response, etag, last_modified=None):
+    """Add ETag, Last-Modified and Cache-Control headers, so clients and proxies can revalidate responses"""
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "public, max-age={}".format(settings.METEO_WARNINGS_MAX_AGE)
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    return with_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+
+
+def parse_time_range(params):
+    """Parse at or from and to params of point-in-time query, returns ((start, end) or None, error)"""
+    if params.get("at"):
+        at = parse_safe_datetime(params["at"])
+        if at is None:
+            return None, "at must be a datetime in format YYYY-MM-DD HH:MM:SS"
+        return (at, at), None
+    if not params.get("from") and not params.get("to"):
+        return None, None
+    start, end = parse_safe_datetime(params.get("from")), parse_safe_datetime(params.get("to"))
+    if start is None or end is None:
+        return None, "from and to must be datetimes in format YYYY-MM-DD HH:MM:SS"
+    if start > end:
+        return None, "from must not be later than to"
+    return (start, end), None
+
+
+def get_district_in_time_range(district_code, start, end):
+    """Function to get district with live and archived warnings valid at any moment of [start, end], returns (data, error).
+    Both tables are searched with GiST index on tstzrange(valid_from, valid_to), archive partitions are pruned by valid_to."""
+    window = DateTimeTZRange(start, end, "[]")
     try:
-        district = District.objects.filter(
-            geom__contains=point
-        ).prefetch_related(
-            Prefetch("meteowarning_set",
-                     queryset=MeteoWarning.objects.filter(valid_to__gte=timezone.now()))
-        ).first()
-        return district, None
+        district = District.objects.only("district_code", "name").get(district_code=district_code)
+        live = list(MeteoWarning.objects.annotate(validity=validity_range()).filter(
+            districts=district_code, validity__overlap=window))
+        archived = list(MeteoWarningArchive.objects.annotate(validity=validity_range()).filter(
+            meteowarningarchivedistrict__district_id=district_code, meteowarningarchivedistrict__valid_to__gte=start,
+            valid_to__gte=start, validity__overlap=window))
     except Exception as e:
         return None, str(e)
+    live_ids = {warning.id for warning in live}
+    warnings = live + [warning for warning in archived if warning.id not in live_ids]
+    # same order as active warnings: valid_from (missing last), id
+    warnings.sort(key=lambda warning: (warning.valid_from is None, warning.valid_from or start, warning.id))
+    return {
+        "district_code": district.district_code,
+        "name": district.name,
+        "lon": None,
+        "lat": None,
+        "warnings": MeteoWarningSerializer(warnings, many=True).data,
+    }, None
+
+
+def parse_tolerance(request):
+    """Parse tolerance (meters) of nearest district fallback, NEAREST_DISTRICT_TOLERANCE is used when it is not given.
+    Returns (tolerance or None, error)."""
+    value = request.query_params.get("tolerance")
+    if value is None:
+        return settings.NEAREST_DISTRICT_TOLERANCE or None, None
+    try:
+        tolerance = float(value)
+    except ValueError:
+        return None, "tolerance must be a number of meters"
+    if not 0 <= tolerance <= settings.NEAREST_DISTRICT_MAX_TOLERANCE:
+        return None, "tolerance must be between 0 and {} meters".format(settings.NEAREST_DISTRICT_MAX_TOLERANCE)
+    return tolerance or None, None
+
+
+def parse_coordinate(value):
+    """Parse coordinate as float, NaN and infinity are rejected with ValueError like other non numbers"""
+    coordinate = float(value)
+    if not math.isfinite(coordinate):
+        raise ValueError("coordinate must be a finite number")
+    return coordinate
 
 
 def check_lat_and_lon(request):
@@ -39,8 +251,8 @@ def check_lat_and_lon(request):
     if lat_param is None or lon_param is None:
         return Response({"error": "lon and lat are required"}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        lat = float(lat_param)
-        lon = float(lon_param)
+        lat = parse_coordinate(lat_param)
+        lon = parse_coordinate(lon_param)
         return {"lat": lat, "lon": lon}
     except ValueError:
         return Response(
@@ -49,24 +261,335 @@ def check_lat_and_lon(request):
         )
 
 
-class MeteoWarningsApiView(APIView):
+def parse_batch_points(data):
+    """Parse batch request body, returns list of (lon, lat) or per point error and error for whole body"""
+    points = data.get("points") if isinstance(data, dict) else data
+    if not isinstance(points, list):
+        return None, "points must be a list of objects with lon and lat"
+    if len(points) > settings.METEO_WARNINGS_BATCH_MAX_POINTS:
+        return None, "Too many points, maximum is {}".format(settings.METEO_WARNINGS_BATCH_MAX_POINTS)
+    parsed = []
+    for item in points:
+        try:
+            parsed.append((parse_coordinate(item["lon"]), parse_coordinate(item["lat"])))
+        except (TypeError, KeyError, ValueError):
+            parsed.append("lon or lat or both are in incorrect format. Remember that both must be numbers.")
+    return parsed, None
+
+
+def encode_cursor(warning):
+    """Opaque cursor pointing after given warning in (valid_to, id) order"""
+    return base64.urlsafe_b64encode(json.dumps([warning.valid_to.isoformat(), warning.id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode cursor created by encode_cursor, returns (valid_to, id)"""
+    try:
+        valid_to, warning_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        valid_to = datetime.fromisoformat(valid_to)
+    except (ValueError, TypeError):
+        raise ValueError("cursor is incorrect")
+    return valid_to, warning_id
+
+
+def get_archive_queryset(params):
+    """Build archive query from request params, returns (queryset, error).
+    Warnings are ordered by (valid_to, id) descending so pages are read from (-valid_to, -id) index,
+    bounds of valid_to are repeated on district links so both partitioned tables are pruned."""
+    warnings = MeteoWarningArchive.objects.prefetch_related(
+        Prefetch("districts", queryset=District.objects.only("district_code"))
+    ).order_by("-valid_to", "-id")
+    district_code = params.get("district")
+    if params.get("lat") is not None or params.get("lon") is not None:
+        try:
+            point, error = create_point(parse_coordinate(params.get("lon")), parse_coordinate(params.get("lat")))
+        except (TypeError, ValueError):
+            return None, "lon or lat or both are in incorrect format. Remember that both must be numbers."
+        if error:
+            return None, "Invalid coordinates: {}".format(error)
+        district_code, error = get_district_code(point)
+        if error:
+            return None, "Database error: {}".format(error)
+        if district_code is None:
+            return None, "Localization is out of Polish Country boundaries"
+    valid_to_bounds = {}
+    if params.get("event"):
+        warnings = warnings.filter(name_of_event=params["event"])
+    if params.get("grade"):
+        warnings = warnings.filter(grade=params["grade"])
+    for name, lookup in (("from", "valid_to__gte"), ("to", "valid_from__lte")):
+        if params.get(name):
+            value = parse_safe_datetime(params[name])
+            if value is None:
+                return None, "{} must be a datetime in format YYYY-MM-DD HH:MM:SS".format(name)
+            warnings = warnings.filter(**{lookup: value})
+            if lookup.startswith("valid_to"):
+                valid_to_bounds[lookup] = value
+    if params.get("cursor"):
+        try:
+            valid_to, warning_id = decode_cursor(params["cursor"])
+        except ValueError as e:
+            return None, str(e)
+        warnings = warnings.filter(valid_to__lte=valid_to).exclude(valid_to=valid_to, id__gte=warning_id)
+        valid_to_bounds["valid_to__lte"] = valid_to
+    if district_code:
+        warnings = warnings.filter(meteowarningarchivedistrict__district_id=district_code, **{
+            "meteowarningarchivedistrict__{}".format(lookup): value for lookup, value in valid_to_bounds.items()})
+    return warnings, None
+
+
+class FastJSONMixin:
+    """Renders successful responses with FastJSONResponse when view_name is listed in FAST_JSON_VIEWS"""
+    view_name = None
+
+    def fast_json(self):
+        return self.view_name in settings.FAST_JSON_VIEWS
+
+    def respond(self, data):
+        return FastJSONResponse(data) if self.fast_json() else Response(data)
+
+
+class MeteoWarningsApiView(FastJSONMixin, APIView):
     """Api View for getting meteo warnings base on lon lat"""
+    view_name = "meteo_warnings"
+
     def get(self, request, *args, **kwargs):
-        result = check_lat_and_lon(request)
-        if "error" in result:
-            return result["error"]
+        with observe_stage("meteo_warnings", "total"):
+            return self.build_response(request)
+
+    def response_etag(self, etag, distance=None):
+        """Districts found by nearest fallback have ETag of their own, their data is flagged as approximate"""
+        return etag if distance is None else '"{}-approximate"'.format(etag.strip('"'))
+
+    def district_response(self, request, data, etag, last_modified=None, distance=None):
+        """Response with district data and validators, districts found by nearest fallback are flagged as approximate"""
+        if distance is not None:
+            data = dict(data, approximate=True, distance=round(distance, 1))
+        etag = self.response_etag(etag, distance)
+        if etag_matches(request, etag):
+            return not_modified(etag, last_modified)
+        return with_validators(self.respond(data), etag, last_modified)
+
+    def build_response(self, request):
+        stage = functools.partial(observe_stage, "meteo_warnings")
+        with stage("validation"):
+            result = check_lat_and_lon(request)
+            tolerance, tolerance_error = parse_tolerance(request)
+            time_range, time_error = parse_time_range(request.query_params)
+        if isinstance(result, Response):
+            return result
+        if tolerance_error or time_error:
+            return Response({"error": tolerance_error or time_error}, status=status.HTTP_400_BAD_REQUEST)
         lat, lon = result["lat"], result["lon"]
+        distance = None
+        use_cache = settings.METEO_WARNINGS_CACHE_ENABLED
         try:
-            point, error = create_point(lon, lat)
-            if error:
-                return Response({"error": "Invalid coordinates: {}".format(error)}, status=status.HTTP_404_NOT_FOUND)
-            district, error = get_district_with_warnings(point)
-            if error:
-                return Response({"error": "Database error: {}".format(error)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
-            if not district:
+            with stage("point_cache"):
+                district_code = get_cached_district_code(lon, lat) if use_cache else None
+            if district_code is None:
+                with stage("create_point"):
+                    point, error = create_point(lon, lat)
+                if error:
+                    return Response({"error": "Invalid coordinates: {}".format(error)}, status=status.HTTP_404_NOT_FOUND)
+                with stage("spatial_query"):
+                    district_code, error = get_district_code(point)
+                if error:
+                    return Response({"error": "Database error: {}".format(error)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+                if use_cache:
+                    set_cached_district_code(lon, lat, district_code)
+            if not district_code and tolerance:
+                with stage("nearest_query"):
+                    nearest, error = get_nearest_district(Point(lon, lat, srid=4326), tolerance)
+                if error:
+                    return Response({"error": "Database error: {}".format(error)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+                if nearest:
+                    district_code, distance = nearest
+            if not district_code:
                 return Response({"error": "Localization is out of Polish Country boundaries"}, status=status.HTTP_404_NOT_FOUND)
-            serializer = DistrictSerializer(district, context={'lon': lon, 'lat': lat})
-            return Response(serializer.data)
+            if time_range:
+                with stage("time_query"):
+                    data, error = get_district_in_time_range(district_code, *time_range)
+                if error:
+                    return Response({"error": "Database error: {}".format(error)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+                return self.district_response(request, with_coordinates(data, lon, lat), district_etag(data),
+                                              distance=distance)
+            if settings.DISTRICT_SNAPSHOTS_ENABLED:
+                with stage("snapshot"):
+                    snapshot = get_district_snapshot(district_code)
+                if snapshot is not None:
+                    etag, last_modified = snapshot_validators(snapshot)
+                    return self.district_response(request, snapshot_data(snapshot, lon, lat), etag, last_modified,
+                                                  distance)
+            with stage("validators"):
+                etag, last_modified = district_validators(district_code)
+            if etag_matches(request, self.response_etag(etag, distance)):
+                return not_modified(self.response_etag(etag, distance), last_modified)
+            generation = get_warnings_generation() if use_cache else None
+            if use_cache:
+                with stage("response_cache"):
+                    data = get_cached_district_data(district_code, generation)
+                if data is not None:
+                    return self.district_response(request, with_coordinates(data, lon, lat), etag, last_modified,
+                                                  distance)
+            if self.fast_json():
+                with stage("warnings_query"):
+                    try:
+                        districts, expiry = get_districts_data([district_code])
+                    except Exception as e:
+                        return Response({"error": "Database error: {}".format(e)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+                if district_code not in districts:
+                    return Response({"error": "Localization is out of Polish Country boundaries"}, status=status.HTTP_404_NOT_FOUND)
+                data, expires_at = with_coordinates(districts[district_code], lon, lat), expiry.get(district_code)
+            else:
+                with stage("warnings_query"):
+                    district, error = get_district_by_code(district_code)
+                if error:
+                    return Response({"error": "Database error: {}".format(error)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+                with stage("serialization"):
+                    data = DistrictSerializer(district, context={'lon': lon, 'lat': lat}).data
+                expires_at = first_warning_expiry(district)
+            if use_cache:
+                set_cached_district_data(district_code, generation, dict(data), expires_at=expires_at)
+            return self.district_response(request, data, etag, last_modified, distance)
         except Exception:
             return Response({"error": "Something went wrong. Try again."}, status=status.HTTP_400_BAD_REQUEST)
 
+
+class MeteoWarningsBatchApiView(FastJSONMixin, APIView):
+    """Api View for getting meteo warnings for many lon lat pairs at once"""
+    view_name = "meteo_warnings_batch"
+
+    def post(self, request, *args, **kwargs):
+        points, error = parse_batch_points(request.data)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        valid = [(i, point) for i, point in enumerate(points) if isinstance(point, tuple)]
+        try:
+            found = get_district_codes_for_points([point for _, point in valid])
+            codes = {valid[i][0]: district_code for i, district_code in found.items()}
+            if self.fast_json():
+                districts, _ = get_districts_data(set(codes.values()))
+            else:
+                districts = {
+                    district.district_code: DistrictSerializer(district).data
+                    for district in get_districts_with_warnings(set(codes.values()))
+                }
+        except Exception as e:
+            return Response({"error": "Database error: {}".format(e)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+        results = []
+        for i, point in enumerate(points):
+            if not isinstance(point, tuple):
+                results.append({"error": point})
+                continue
+            lon, lat = point
+            district_code = codes.get(i)
+            if district_code is None:
+                results.append({"lon": lon, "lat": lat, "error": "Localization is out of Polish Country boundaries"})
+            else:
+                results.append(with_coordinates(districts[district_code], lon, lat))
+        return self.respond({"results": results})
+
+
+async def meteo_warnings_stream(request):
+    """Server-Sent Events stream of warning changes for a point (lon, lat) or TERYT codes (districts=3021,3064).
+    Has to be served through ASGI application, every connection is an idle coroutine."""
+    if not isinstance(request, ASGIRequest):
+        # WSGI server would hold a worker thread for every connected client until it disconnects
+        return JsonResponse({"error": "Stream is available only when served through ASGI"},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+    lon = lat = None
+    if request.GET.get("districts"):
+        district_codes = sorted({code.strip() for code in request.GET["districts"].split(",") if code.strip()})
+        if len(district_codes) > settings.SSE_MAX_DISTRICTS:
+            return JsonResponse({"error": "Too many districts, maximum is {}".format(settings.SSE_MAX_DISTRICTS)},
+                                status=status.HTTP_400_BAD_REQUEST)
+        existing = [code async for code in District.objects.filter(
+            district_code__in=district_codes).values_list("district_code", flat=True)]
+        if len(existing) != len(district_codes):
+            return JsonResponse({"error": "Unknown districts: {}".format(
+                ",".join(sorted(set(district_codes) - set(existing))))}, status=status.HTTP_404_NOT_FOUND)
+    else:
+        try:
+            lat = parse_coordinate(request.GET["lat"])
+            lon = parse_coordinate(request.GET["lon"])
+        except (KeyError, ValueError):
+            return JsonResponse({"error": "districts or lon and lat are required"}, status=status.HTTP_400_BAD_REQUEST)
+        point, error = create_point(lon, lat)
+        if error:
+            return JsonResponse({"error": "Invalid coordinates: {}".format(error)}, status=status.HTTP_404_NOT_FOUND)
+        district_code, error = await sync_to_async(get_district_code)(point)
+        if error:
+            return JsonResponse({"error": "Database error: {}".format(error)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+        if not district_code:
+            return JsonResponse({"error": "Localization is out of Polish Country boundaries"}, status=status.HTTP_404_NOT_FOUND)
+        district_codes = [district_code]
+    response = StreamingHttpResponse(district_events(district_codes, lon, lat), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def district_tiles(request, z, x, y):
+    """Mapbox Vector Tile with districts and their active warnings (max_grade, events, warnings count)"""
+    if not tile_is_valid(z, x, y):
+        return JsonResponse({"error": "Tile does not exist"}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        tile, etag = get_tile(z, x, y)
+    except Exception as e:
+        return JsonResponse({"error": "Database error: {}".format(e)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+    if etag_matches(request, etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile")
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age={}".format(settings.METEO_WARNINGS_MAX_AGE)
+    return response
+
+
+def meteo_warnings_export(request):
+    """Stream all active warnings joined with geometry of their districts as GeoJSON (default) or NDJSON"""
+    export_format = request.GET.get("format", "geojson")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"error": "format must be one of: {}".format(", ".join(EXPORT_FORMATS))},
+                            status=status.HTTP_400_BAD_REQUEST)
+    try:
+        simplify = float(request.GET["simplify"]) if request.GET.get("simplify") else None
+    except ValueError:
+        return JsonResponse({"error": "simplify must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+    content_type = "application/x-ndjson" if export_format == "ndjson" else "application/geo+json"
+    # under ASGI sync iterator would be consumed whole before sending first byte
+    chunks = aexport_chunks if isinstance(request, ASGIRequest) else export_chunks
+    response = StreamingHttpResponse(chunks(export_format, simplify), content_type=content_type)
+    response["Content-Disposition"] = 'attachment; filename="meteo_warnings.{}"'.format(export_format)
+    return response
+
+
+class MeteoWarningsArchiveApiView(APIView):
+    """Api View for browsing archived meteo warnings with cursor pagination, newest valid_to first"""
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get("limit", settings.ARCHIVE_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be at least 1"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, settings.ARCHIVE_MAX_PAGE_SIZE)
+        warnings, error = get_archive_queryset(request.query_params)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = list(warnings[:limit + 1])
+        except Exception as e:
+            return Response({"error": "Database error: {}".format(e)}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return Response({
+            "results": MeteoWarningArchiveSerializer(page[:limit], many=True).data,
+            "next": next_cursor,
+        })
+
+
+def metrics(request):
+    """Prometheus metrics of API and celery tasks"""
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
+
@@ -0,0 +1,96 @@
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from django.utils import timezone
+
+from satagro.models import MeteoWarning, MeteoWarningArchive, MeteoWarningArchiveDistrict
+from satagro.sync import WARNING_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def _tables():
+    qn = connection.ops.quote_name
+    warning_m2m = MeteoWarning._meta.get_field("districts")
+    archive_links = MeteoWarningArchiveDistrict._meta
+    return {
+        "warning": qn(MeteoWarning._meta.db_table),
+        "archive": qn(MeteoWarningArchive._meta.db_table),
+        "warning_districts": qn(warning_m2m.m2m_db_table()),
+        "warning_fk": qn(warning_m2m.m2m_column_name()),
+        "warning_district_fk": qn(warning_m2m.m2m_reverse_name()),
+        "archive_districts": qn(archive_links.db_table),
+        "archive_fk": qn(archive_links.get_field("meteowarningarchive").column),
+        "archive_district_fk": qn(archive_links.get_field("district").column),
+        "columns": ", ".join(qn(column) for column in ["id"] + WARNING_FIELDS),
+        "updates": ", ".join("{0} = EXCLUDED.{0}".format(qn(column)) for column in WARNING_FIELDS
+                             if column != "valid_to"),
+    }
+
+
+def archive_chunk(cursor, tables, now, chunk_size, ids=None):
+    """Move one chunk of expired warnings with their districts to archive, returns ids of moved warnings and their districts.
+    With ids only those of given warnings which already expired are moved."""
+    if ids is None:
+        cursor.execute(
+            "SELECT id FROM {warning} WHERE valid_to < %s ORDER BY valid_to, id LIMIT %s FOR UPDATE SKIP LOCKED".format(**tables),
+            [now, chunk_size])
+    else:
+        cursor.execute(
+            "SELECT id FROM {warning} WHERE valid_to < %s AND id = ANY(%s) ORDER BY valid_to, id LIMIT %s "
+            "FOR UPDATE SKIP LOCKED".format(**tables), [now, list(ids), chunk_size])
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return [], set()
+    # archive is partitioned by valid_to, warning archived again with different valid_to replaces old row
+    cursor.execute(
+        "DELETE FROM {archive} USING {warning} WHERE {warning}.id = ANY(%s) "
+        "AND {archive}.id = {warning}.id AND {archive}.valid_to <> {warning}.valid_to".format(**tables), [ids])
+    cursor.execute(
+        "INSERT INTO {archive} ({columns}) SELECT {columns} FROM {warning} WHERE id = ANY(%s) "
+        "ON CONFLICT (id, valid_to) DO UPDATE SET {updates}".format(**tables), [ids])
+    cursor.execute("DELETE FROM {archive_districts} WHERE {archive_fk} = ANY(%s)".format(**tables), [ids])
+    cursor.execute(
+        "INSERT INTO {archive_districts} ({archive_fk}, {archive_district_fk}, valid_to) "
+        "SELECT {warning_districts}.{warning_fk}, {warning_districts}.{warning_district_fk}, {warning}.valid_to "
+        "FROM {warning_districts} JOIN {warning} ON {warning}.id = {warning_districts}.{warning_fk} "
+        "WHERE {warning_districts}.{warning_fk} = ANY(%s)".format(**tables),
+        [ids])
+    cursor.execute("DELETE FROM {warning_districts} WHERE {warning_fk} = ANY(%s) "
+                   "RETURNING {warning_district_fk}".format(**tables), [ids])
+    districts = {row[0] for row in cursor.fetchall()}
+    cursor.execute("DELETE FROM {warning} WHERE id = ANY(%s)".format(**tables), [ids])
+    return ids, districts
+
+
+def archive_expired_warnings(now=None, chunk_size=None):
+    """Move warnings expired before now to archive in chunks, every chunk is a separate transaction.
+    Returns number of archived warnings and codes of districts they were linked to."""
+    now = now or timezone.now()
+    chunk_size = chunk_size or settings.ARCHIVE_CHUNK_SIZE
+    tables = _tables()
+    archived, districts = 0, set()
+    while True:
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                moved, chunk_districts = archive_chunk(cursor, tables, now, chunk_size)
+        except DatabaseError as e:
+            logger.error("Could not archive chunk of warnings: {}".format(e))
+            return archived, districts
+        archived += len(moved)
+        districts |= chunk_districts
+        if len(moved) < chunk_size:
+            return archived, districts
+
+
+def archive_warnings(warning_ids, now=None):
+    """Move given warnings which expired before now to archive in one transaction, warnings locked by other
+    transaction are skipped. Returns ids of archived warnings and codes of districts they were linked to."""
+    now = now or timezone.now()
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            return archive_chunk(cursor, _tables(), now, len(warning_ids), warning_ids)
+    except DatabaseError as e:
+        logger.error("Could not archive warnings: {}".format(e))
+        return [], set()
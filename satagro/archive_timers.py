@@ -0,0 +1,68 @@
+import logging
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of warning ids scored by timestamp of their valid_to
+TIMERS_KEY = "satagro:archive_timers"
+
+# Timer is removed only when it was not moved to later valid_to in the meantime
+_REMOVE_DUE_SCRIPT = """
+local removed = 0
+for i, member in ipairs(ARGV) do
+    if i > 1 then
+        local score = redis.call("zscore", KEYS[1], member)
+        if score and tonumber(score) < tonumber(ARGV[1]) then
+            removed = removed + redis.call("zrem", KEYS[1], member)
+        end
+    end
+end
+return removed
+"""
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.ARCHIVE_TIMERS_REDIS_URL, decode_responses=True)
+    return _client
+
+
+def schedule_archiving(valid_to):
+    """Set archive timers of warnings ({id: valid_to}) to their valid_to, existing timers are moved"""
+    timers = {warning_id: moment.timestamp() for warning_id, moment in valid_to.items() if moment is not None}
+    if not timers:
+        return
+    try:
+        get_client().zadd(TIMERS_KEY, timers)
+    except redis.RedisError as e:
+        logger.error("Could not schedule archiving of warnings: {}".format(e))
+
+
+def due_warnings(now=None, limit=None):
+    """Ids of warnings which expired before now, same condition as archive_expired_warnings"""
+    now = now or timezone.now()
+    try:
+        return get_client().zrangebyscore(TIMERS_KEY, "-inf", "({}".format(now.timestamp()), start=0,
+                                          num=limit or settings.ARCHIVE_CHUNK_SIZE)
+    except redis.RedisError as e:
+        logger.error("Could not read archive timers: {}".format(e))
+        return []
+
+
+def remove_due_timers(warning_ids, now):
+    """Remove timers of warnings handled at now, unless they were rescheduled to later moment.
+    Returns False when timers could not be removed."""
+    if not warning_ids:
+        return True
+    try:
+        get_client().eval(_REMOVE_DUE_SCRIPT, 1, TIMERS_KEY, now.timestamp(), *warning_ids)
+    except redis.RedisError as e:
+        logger.error("Could not remove archive timers: {}".format(e))
+        return False
+    return True
@@ -0,0 +1,131 @@
+import json
+import logging
+import platform
+import random
+import subprocess
+import time
+from datetime import timedelta
+
+import django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Bounding box of Poland (lon_min, lat_min, lon_max, lat_max)
+POLAND_BBOX = (14.12, 49.0, 24.15, 54.84)
+
+
+def coordinate_grid(step=0.25, bbox=POLAND_BBOX):
+    """Fixed grid of (lon, lat) pairs covering bounding box, points outside of country are kept on purpose"""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    columns, rows = int((lon_max - lon_min) / step) + 1, int((lat_max - lat_min) / step) + 1
+    return [(round(lon_min + column * step, 6), round(lat_min + row * step, 6))
+            for row in range(rows) for column in range(columns)]
+
+
+def percentile(values, pct):
+    """Percentile of values with linear interpolation between closest ranks"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarize(durations, queries):
+    """Latency percentiles (ms), throughput and query counts of measured calls"""
+    total = sum(durations)
+    return {
+        "calls": len(durations),
+        "total_s": round(total, 4),
+        "calls_per_s": round(len(durations) / total, 2) if total else None,
+        "mean_ms": round(total / len(durations) * 1000, 3),
+        "p50_ms": round(percentile(durations, 50) * 1000, 3),
+        "p90_ms": round(percentile(durations, 90) * 1000, 3),
+        "p95_ms": round(percentile(durations, 95) * 1000, 3),
+        "p99_ms": round(percentile(durations, 99) * 1000, 3),
+        "max_ms": round(max(durations) * 1000, 3),
+        "queries": queries,
+        "queries_per_call": round(queries / len(durations), 2),
+    }
+
+
+def measure_calls(func, arguments, warmup=5):
+    """Call func with every tuple of arguments, returns summary of latencies and executed queries"""
+    for args in arguments[:warmup]:
+        func(*args)
+    durations, queries = [], 0
+    for args in arguments:
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func(*args)
+            durations.append(time.perf_counter() - start)
+        queries += len(context.captured_queries)
+    return summarize(durations, queries)
+
+
+def measure_batch(func, rows):
+    """Call func once, returns duration, executed queries and processed rows per second"""
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        result = func()
+        duration = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "duration_s": round(duration, 4),
+        "rows_per_s": round(rows / duration, 2) if duration else None,
+        "queries": len(context.captured_queries),
+    }, result
+
+
+def synthetic_events(count, district_codes, seed=0, published=None):
+    """IMGW-like payload of count warnings linked with random districts, same seed gives same payload"""
+    generator = random.Random(seed)
+    now = timezone.now()
+    published = published or now - timedelta(hours=1)
+    events = []
+    for i in range(count):
+        valid_from = now + timedelta(hours=generator.randint(-12, 12))
+        events.append({
+            "id": "bench{:06d}".format(i),
+            "nazwa_zdarzenia": generator.choice(["Burze", "Silny wiatr", "Intensywne opady deszczu", "Upał"]),
+            "stopien": str(generator.randint(1, 3)),
+            "prawdopodobienstwo": generator.choice([70, 80, 90]),
+            "obowiazuje_od": valid_from.strftime("%Y-%m-%d %H:%M:%S"),
+            "obowiazuje_do": (valid_from + timedelta(hours=generator.randint(6, 48))).strftime("%Y-%m-%d %H:%M:%S"),
+            "opublikowano": published.strftime("%Y-%m-%d %H:%M:%S"),
+            "tresc": "Prognozuje się burze z opadami deszczu od 20 mm do 30 mm.",
+            "komentarz": "",
+            "biuro": "Biuro Prognoz Meteorologicznych w Warszawie",
+            "teryt": generator.sample(district_codes, generator.randint(1, 20)),
+        })
+    return events
+
+
+def git_commit():
+    """Commit of working tree benchmarks were run on, None outside of git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results, path):
+    """Write benchmark results with environment description to JSON file"""
+    document = {
+        "commit": git_commit(),
+        "created": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    logger.info("Benchmark results saved to {}".format(path))
+    return document
@@ -0,0 +1,152 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DISTRICTS_VERSION_KEY = "satagro:districts_version"
+WARNINGS_GENERATION_KEY = "satagro:warnings_generation"
+COUNTRY_ENVELOPE_KEY = "satagro:country_envelope"
+
+OUT_OF_BOUNDS = ""
+
+
+def _get_counter(key):
+    try:
+        return cache.get_or_set(key, 1, timeout=None)
+    except Exception as e:
+        logger.error("Could not read counter {}: {}".format(key, e))
+        return None
+
+
+def _bump_counter(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+        return 2
+    except Exception as e:
+        logger.error("Could not bump counter {}: {}".format(key, e))
+        return None
+
+
+def get_districts_version():
+    """Return current version of districts table shared between processes"""
+    return _get_counter(DISTRICTS_VERSION_KEY)
+
+
+def bump_districts_version():
+    """Mark districts table as changed so every process drops data derived from it"""
+    return _bump_counter(DISTRICTS_VERSION_KEY)
+
+
+def get_cached_country_envelope():
+    """Return precomputed extent (xmin, ymin, xmax, ymax) of the country or None"""
+    try:
+        return cache.get(COUNTRY_ENVELOPE_KEY)
+    except Exception as e:
+        logger.error("Could not read country envelope: {}".format(e))
+        return None
+
+
+def set_cached_country_envelope(extent):
+    try:
+        cache.set(COUNTRY_ENVELOPE_KEY, extent, timeout=None)
+    except Exception as e:
+        logger.error("Could not store country envelope: {}".format(e))
+
+
+def get_warnings_generation():
+    """Return generation of meteo warnings, it changes every time warnings are modified"""
+    return _get_counter(WARNINGS_GENERATION_KEY)
+
+
+def bump_warnings_generation():
+    """Invalidate every cached response built from meteo warnings"""
+    return _bump_counter(WARNINGS_GENERATION_KEY)
+
+
+def _point_key(lon, lat, districts_version):
+    precision = settings.POINT_CACHE_PRECISION
+    return "satagro:point:{}:{:.{p}f}:{:.{p}f}".format(districts_version, lon, lat, p=precision)
+
+
+def get_cached_district_code(lon, lat):
+    """Return district code cached for quantized coordinates, OUT_OF_BOUNDS or None when unknown"""
+    districts_version = get_districts_version()
+    if districts_version is None:
+        return None
+    try:
+        return cache.get(_point_key(lon, lat, districts_version))
+    except Exception as e:
+        logger.error("Could not read point cache: {}".format(e))
+        return None
+
+
+def set_cached_district_code(lon, lat, district_code):
+    """Remember district for quantized coordinates, None means point is out of country bounds.
+    Points out of bounds are remembered only for a short time, any coordinates can be requested."""
+    districts_version = get_districts_version()
+    if districts_version is None:
+        return
+    timeout = settings.POINT_CACHE_TIMEOUT if district_code else settings.POINT_CACHE_MISS_TIMEOUT
+    try:
+        cache.set(_point_key(lon, lat, districts_version),
+                  district_code or OUT_OF_BOUNDS,
+                  timeout=timeout)
+    except Exception as e:
+        logger.error("Could not write point cache: {}".format(e))
+
+
+def _district_key(district_code, generation):
+    return "satagro:district:{}:{}".format(district_code, generation)
+
+
+def get_cached_district_data(district_code, generation):
+    """Return serialized district with warnings stored for given warnings generation"""
+    if generation is None:
+        return None
+    try:
+        return cache.get(_district_key(district_code, generation))
+    except Exception as e:
+        logger.error("Could not read district cache: {}".format(e))
+        return None
+
+
+def set_cached_district_data(district_code, generation, data, expires_at=None):
+    """Store serialized district, entry expires together with its first warning or after
+    METEO_WARNINGS_CACHE_TIMEOUT, whichever comes first"""
+    if generation is None:
+        return
+    timeout = settings.METEO_WARNINGS_CACHE_TIMEOUT
+    if expires_at is not None:
+        timeout = min(timeout, (expires_at - timezone.now()).total_seconds())
+        if timeout <= 0:
+            return
+    try:
+        cache.set(_district_key(district_code, generation), data, timeout=timeout)
+    except Exception as e:
+        logger.error("Could not write district cache: {}".format(e))
+
+
+def _feed_key(url):
+    return "satagro:feed:{}".format(url)
+
+
+def get_feed_state(url):
+    """Return ETag, Last-Modified and content hash of last processed feed response"""
+    try:
+        return cache.get(_feed_key(url))
+    except Exception as e:
+        logger.error("Could not read feed state: {}".format(e))
+        return None
+
+
+def save_feed_state(url, state):
+    """Remember last processed feed response"""
+    try:
+        cache.set(_feed_key(url), state, timeout=None)
+    except Exception as e:
+        logger.error("Could not write feed state: {}".format(e))
@@ -1,16 +1,29 @@
 from datetime import timedelta
 
 import pytest
+from django.core.cache import cache
 from django.utils import timezone
 
+from satagro.district_index import reset_district_index
 from satagro.models import MeteoWarning
 
 
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    """Every test starts with empty in-memory cache instead of shared Redis, so no state leaks between tests"""
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    cache.clear()
+    reset_district_index()
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def warning_factory(db):
     """MeteoWarning factory"""
     def create_warning(
         valid_to_delta=None,
+        id="",
         name_of_event="Test Event",
         grade="A",
         probability=50,
@@ -21,6 +34,7 @@ def warning_factory(db):
         office="Test office"
     ):
         return MeteoWarning.objects.create(
+            id=id,
             name_of_event=name_of_event,
             grade=grade,
             probability=probability,
@@ -46,9 +60,9 @@ def default_event():
         "nazwa_zdarzenia": "Test Event",
         "stopien": "A",
         "prawdopodobienstwo": 50,
-        "obowiazuje_do": valid_to,
-        "obowiazuje_od": valid_from,
-        "opublikowano": published,
+        "obowiazuje_do": valid_to.isoformat(),
+        "obowiazuje_od": valid_from.isoformat(),
+        "opublikowano": published.isoformat(),
         "tresc": "Test content",
         "komentarz": "Test comment",
         "biuro": "Test office",
@@ -67,9 +81,9 @@ def create_event_with_params(**kwargs):
         "nazwa_zdarzenia": "Test Event",
         "stopien": "A",
         "prawdopodobienstwo": 50,
-        "obowiazuje_do": valid_to,
-        "obowiazuje_od": valid_from,
-        "opublikowano": published,
+        "obowiazuje_do": valid_to.isoformat(),
+        "obowiazuje_od": valid_from.isoformat(),
+        "opublikowano": published.isoformat(),
         "tresc": "Test content",
         "komentarz": "Test comment",
         "biuro": "Test office",
@@ -0,0 +1,216 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.gis.db.models import Extent
+from django.contrib.gis.geos import Point
+
+from satagro.cache import get_cached_country_envelope, get_districts_version, set_cached_country_envelope
+from satagro.models import District, Voivodeship
+
+logger = logging.getLogger(__name__)
+
+
+def _union(extents):
+    xmin, ymin, xmax, ymax = zip(*extents)
+    return min(xmin), min(ymin), max(xmax), max(ymax)
+
+
+def _center(extent):
+    return (extent[0] + extent[2]) / 2, (extent[1] + extent[3]) / 2
+
+
+class STRtree:
+    """Read only R-tree packed with Sort-Tile-Recursive algorithm over (extent, item) pairs"""
+
+    def __init__(self, entries, node_capacity=10):
+        nodes = [(extent, item, True) for extent, item in entries]
+        self._root = None
+        if not nodes:
+            return
+        while len(nodes) > 1:
+            nodes = self._pack(nodes, node_capacity)
+        self._root = nodes[0]
+
+    @staticmethod
+    def _pack(nodes, node_capacity):
+        parents_count = math.ceil(len(nodes) / node_capacity)
+        slice_size = math.ceil(math.sqrt(parents_count)) * node_capacity
+        nodes = sorted(nodes, key=lambda node: _center(node[0])[0])
+        parents = []
+        for i in range(0, len(nodes), slice_size):
+            vertical_slice = sorted(nodes[i:i + slice_size], key=lambda node: _center(node[0])[1])
+            for j in range(0, len(vertical_slice), node_capacity):
+                children = vertical_slice[j:j + node_capacity]
+                parents.append((_union([child[0] for child in children]), children, False))
+        return parents
+
+    def query(self, x, y):
+        """Yield items whose extent contains given coordinates"""
+        if self._root is None:
+            return
+        stack = [self._root]
+        while stack:
+            extent, payload, is_leaf = stack.pop()
+            if not (extent[0] <= x <= extent[2] and extent[1] <= y <= extent[3]):
+                continue
+            if is_leaf:
+                yield payload
+            else:
+                stack.extend(payload)
+
+
+def _prepare(geom):
+    prepared = geom.prepared
+    # GEOS builds prepared geometry internals lazily, warm them up before sharing between threads
+    prepared.contains(geom.point_on_surface)
+    return prepared
+
+
+def _contains_extent(extent, x, y):
+    return extent[0] <= x <= extent[2] and extent[1] <= y <= extent[3]
+
+
+class DistrictIndex:
+    """In-memory two level district lookup: country envelope, voivodeships, then districts of matched voivodeship.
+    Every level is a bounding boxes tree with prepared geometries."""
+
+    def __init__(self, districts, voivodeships=()):
+        voivodeship_geoms = dict(voivodeships)
+        entries = defaultdict(list)
+        for district_code, geom in districts:
+            entries[district_code[:2]].append((geom.extent, (district_code, _prepare(geom))))
+        voivodeship_entries = []
+        for code, district_entries in entries.items():
+            # voivodeship without stored geometry (not generated yet) is matched by its districts only
+            geom = voivodeship_geoms.get(code)
+            extent = geom.extent if geom is not None else _union([extent for extent, _ in district_entries])
+            prepared = _prepare(geom) if geom is not None else None
+            voivodeship_entries.append((extent, (prepared, STRtree(district_entries))))
+        self.size = sum(len(district_entries) for district_entries in entries.values())
+        self.envelope = _union([extent for extent, _ in voivodeship_entries]) if voivodeship_entries else None
+        self._tree = STRtree(voivodeship_entries)
+
+    @classmethod
+    def from_db(cls):
+        return cls(District.objects.values_list("district_code", "geom").iterator(),
+                   Voivodeship.objects.values_list("code", "geom"))
+
+    def lookup(self, point):
+        """Return code of district which contains point or None"""
+        return self.lookup_xy(point.x, point.y, point)
+
+    def lookup_xy(self, x, y, point=None):
+        """Return code of district which contains coordinates or None, GEOS point is created only when
+        coordinates pass bounding boxes of country and voivodeship"""
+        if self.envelope is None or not _contains_extent(self.envelope, x, y):
+            return None
+        for voivodeship, districts in self._tree.query(x, y):
+            if point is None:
+                point = Point(x, y, srid=4326)
+            if voivodeship is not None and not voivodeship.covers(point):
+                continue
+            for district_code, prepared in districts.query(x, y):
+                if prepared.contains(point):
+                    return district_code
+        return None
+
+
+class _VersionedHolder:
+    """Process wide value derived from districts, rebuilt when districts version changed.
+    Version is checked at most once per DISTRICT_INDEX_CHECK_INTERVAL seconds."""
+
+    def __init__(self, build):
+        self.build = build
+        self.lock = threading.Lock()
+        self.value = None
+        self.version = None
+        self.checked_at = 0.0
+
+    def _fresh(self, now):
+        return self.value is not None and now - self.checked_at < settings.DISTRICT_INDEX_CHECK_INTERVAL
+
+    def get(self):
+        now = time.monotonic()
+        if self._fresh(now):
+            return self.value
+        # while one thread rebuilds the value others keep serving the previous one instead of waiting
+        if not self.lock.acquire(blocking=self.value is None):
+            return self.value
+        try:
+            if self._fresh(now):
+                return self.value
+            version = get_districts_version()
+            if self.value is None or (version is not None and version != self.version):
+                self.value = self.build()
+                self.version = version
+            self.checked_at = now
+        finally:
+            self.lock.release()
+        return self.value
+
+    def reset(self):
+        with self.lock:
+            self.value = None
+            self.version = None
+            self.checked_at = 0.0
+
+
+def _build_district_index():
+    started = time.monotonic()
+    index = DistrictIndex.from_db()
+    logger.info("District index built with {} districts in {:.3f}s".format(index.size, time.monotonic() - started))
+    return index
+
+
+def _build_country_envelope():
+    envelope = get_cached_country_envelope()
+    if envelope is None:
+        envelope = Voivodeship.objects.aggregate(extent=Extent("geom"))["extent"]
+        if envelope is None:
+            # districts are not imported yet, nothing can be rejected
+            return NO_ENVELOPE
+        set_cached_country_envelope(envelope)
+    return tuple(envelope)
+
+
+NO_ENVELOPE = ()
+
+_index_holder = _VersionedHolder(_build_district_index)
+_envelope_holder = _VersionedHolder(_build_country_envelope)
+
+
+def get_district_index():
+    """Return process wide district index, rebuild it when districts table version changed"""
+    return _index_holder.get()
+
+
+def in_country_envelope(point):
+    """Cheap check of point against precomputed extent of the country, points outside can not be in any district.
+    When envelope can not be loaded nothing is rejected, spatial query decides."""
+    try:
+        envelope = _envelope_holder.get()
+    except Exception as e:
+        logger.error("Could not load country envelope: {}".format(e))
+        return True
+    return envelope == NO_ENVELOPE or _contains_extent(envelope, point.x, point.y)
+
+
+def extent_in_country_envelope(extent):
+    """Check if extent (xmin, ymin, xmax, ymax) overlaps envelope of the country, like in_country_envelope"""
+    try:
+        envelope = _envelope_holder.get()
+    except Exception as e:
+        logger.error("Could not load country envelope: {}".format(e))
+        return True
+    return envelope == NO_ENVELOPE or (extent[0] <= envelope[2] and envelope[0] <= extent[2]
+                                       and extent[1] <= envelope[3] and envelope[1] <= extent[3])
+
+
+def reset_district_index():
+    """Drop process wide district index and country envelope, next lookup will build them again"""
+    _index_holder.reset()
+    _envelope_holder.reset()
@@ -0,0 +1,259 @@
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.contrib.gis.gdal import DataSource
+from django.contrib.gis.geos import GEOSGeometry, Polygon, MultiPolygon
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from satagro.models import District, DistrictPart, MeteoWarning, MeteoWarningArchiveDistrict, Voivodeship
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Return sha256 of file content"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_feature_datetime(value):
+    """Parse datetime attribute of a Geoportal feature"""
+    return timezone.make_aware(parse_datetime(value)) if value else None
+
+
+def read_district_features(file_path, skip_codes=()):
+    """Read attributes and WKB geometry of districts from Geoportal file, returns (features, source srid)"""
+    layer = DataSource(file_path)[0]
+    features = []
+    for feature in layer:
+        try:
+            district_code = feature["JPT_KOD_JE"].value
+            if district_code in skip_codes:
+                continue
+            features.append({
+                "district_code": district_code,
+                "id": feature["JPT_ID"].value,
+                "name": str(feature["JPT_NAZWA_"]),
+                "type": str(feature["JPT_SJR_KO"]),
+                "version_from": parse_feature_datetime(feature["WERSJA_OD"].value),
+                "version_to": parse_feature_datetime(feature["WERSJA_DO"].value),
+                "valid_from": parse_feature_datetime(feature["WAZNY_OD"].value),
+                "valid_to": parse_feature_datetime(feature["WAZNY_DO"].value),
+                "regon": str(feature["REGON"]),
+                "wkb": bytes(feature.geom.wkb),
+            })
+        except Exception as e:
+            logger.error("Error processing feature: {}".format(e))
+    return features, layer.srs.srid
+
+
+def transform_geometry(wkb, srid):
+    """Reproject WKB geometry to WGS84 and normalise it to MultiPolygon, returns WKB or None if it failed"""
+    try:
+        polygon = GEOSGeometry(memoryview(wkb), srid=srid)
+        polygon.transform(4326)
+        if isinstance(polygon, Polygon):
+            polygon = MultiPolygon(polygon)
+        return bytes(polygon.wkb)
+    except Exception as e:
+        logger.error("Error transforming geometry: {}".format(e))
+        return None
+
+
+def transform_geometries(wkbs, srid, workers=None):
+    """Transform geometries across a process pool, daemonic processes (celery pool) transform them in place"""
+    workers = workers or settings.DISTRICT_IMPORT_WORKERS or multiprocessing.cpu_count()
+    if workers <= 1 or len(wkbs) <= 1 or multiprocessing.current_process().daemon:
+        return [transform_geometry(wkb, srid) for wkb in wkbs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(transform_geometry, wkbs, [srid] * len(wkbs),
+                                 chunksize=max(1, len(wkbs) // (workers * 4))))
+
+
+def build_districts(features, srid):
+    """Create unsaved District objects from features read by read_district_features"""
+    geometries = transform_geometries([feature["wkb"] for feature in features], srid)
+    districts = []
+    for feature, wkb in zip(features, geometries):
+        if wkb is None:
+            logger.error("Skipping district {} without geometry".format(feature["district_code"]))
+            continue
+        fields = {name: value for name, value in feature.items() if name != "wkb"}
+        districts.append(District(geom=GEOSGeometry(memoryview(wkb), srid=4326), **fields))
+    return districts
+
+
+def refresh_district_parts(district_codes=None, max_vertices=None):
+    """Rebuild subdivided geometries of given districts (all districts when None)"""
+    max_vertices = max_vertices or settings.DISTRICT_SUBDIVIDE_MAX_VERTICES
+    qn = connection.ops.quote_name
+    parts_table, districts_table = qn(DistrictPart._meta.db_table), qn(District._meta.db_table)
+    parts_condition, districts_condition, params = "", "", []
+    if district_codes is not None:
+        parts_condition, districts_condition = "WHERE district_id = ANY(%s)", "WHERE district_code = ANY(%s)"
+        params = [list(district_codes)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {} {}".format(parts_table, parts_condition), params)
+        cursor.execute(
+            "INSERT INTO {} (district_id, geom) SELECT district_code, ST_Multi(ST_Subdivide(geom, %s)) "
+            "FROM {} {}".format(parts_table, districts_table, districts_condition),
+            [max_vertices] + params)
+
+
+def refresh_voivodeships():
+    """Rebuild voivodeship geometries by dissolving districts grouped by the first two digits of TERYT code,
+    returns extent (xmin, ymin, xmax, ymax) of the whole country or None when there are no districts"""
+    qn = connection.ops.quote_name
+    voivodeships_table, districts_table = qn(Voivodeship._meta.db_table), qn(District._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {}".format(voivodeships_table))
+        cursor.execute(
+            "INSERT INTO {} (code, geom) SELECT left(district_code, 2), ST_Multi(ST_CollectionExtract(ST_Union(geom), 3)) "
+            "FROM {} GROUP BY left(district_code, 2)".format(voivodeships_table, districts_table))
+        cursor.execute("SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent) "
+                       "FROM (SELECT ST_Extent(geom) AS extent FROM {}) country".format(voivodeships_table))
+        extent = cursor.fetchone()
+    return None if extent[0] is None else extent
+
+
+@dataclass
+class DistrictSwapResult:
+    """Districts changed by swap_districts, remapped maps removed district code to codes of its successors"""
+    created: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    remapped: dict = field(default_factory=dict)
+
+    @property
+    def changed(self):
+        return bool(self.created or self.updated or self.removed)
+
+    @property
+    def affected(self):
+        """Codes of existing districts which geometry or warnings changed"""
+        successors = {code for codes in self.remapped.values() for code in codes}
+        return set(self.created) | set(self.updated) | successors
+
+    def as_dict(self):
+        return {"created": len(self.created), "updated": len(self.updated), "removed": len(self.removed)}
+
+
+def _swap_tables():
+    qn = connection.ops.quote_name
+    warning_m2m = MeteoWarning._meta.get_field("districts")
+    archive_links = MeteoWarningArchiveDistrict._meta
+    columns = [f.column for f in District._meta.concrete_fields]
+    return {
+        "districts": qn(District._meta.db_table),
+        "parts": qn(DistrictPart._meta.db_table),
+        "staging": qn("satagro_district_staging"),
+        "staging_parts": qn("satagro_districtpart_staging"),
+        "warning_districts": qn(warning_m2m.m2m_db_table()),
+        "warning_fk": qn(warning_m2m.m2m_column_name()),
+        "warning_district_fk": qn(warning_m2m.m2m_reverse_name()),
+        "archive_districts": qn(archive_links.db_table),
+        "archive_fk": qn(archive_links.get_field("meteowarningarchive").column),
+        "archive_district_fk": qn(archive_links.get_field("district").column),
+        "columns": ", ".join(qn(column) for column in columns),
+        "values": ", ".join("ST_GeomFromWKB(%s, 4326)" if column == "geom" else "%s" for column in columns),
+        "updates": ", ".join("{0} = EXCLUDED.{0}".format(qn(column)) for column in columns if column != "district_code"),
+        "current": ", ".join("{}.{}".format(qn(District._meta.db_table), qn(column)) for column in columns),
+        "excluded": ", ".join("EXCLUDED.{}".format(qn(column)) for column in columns),
+    }
+
+
+def stage_districts(cursor, tables, districts, max_vertices):
+    """Load districts into temporary staging tables of this connection together with their subdivided parts,
+    expensive work is done here so that the swap itself is short"""
+    cursor.execute("CREATE TEMP TABLE {staging} (LIKE {districts} INCLUDING DEFAULTS)".format(**tables))
+    fields = District._meta.concrete_fields
+    rows = [[bytes(district.geom.wkb) if f.column == "geom" else getattr(district, f.attname) for f in fields]
+            for district in districts]
+    cursor.executemany("INSERT INTO {staging} ({columns}) VALUES ({values})".format(**tables), rows)
+    cursor.execute("CREATE UNIQUE INDEX ON {staging} (district_code)".format(**tables))
+    cursor.execute("CREATE INDEX ON {staging} USING GIST (geom)".format(**tables))
+    cursor.execute(
+        "CREATE TEMP TABLE {staging_parts} AS SELECT district_code AS district_id, "
+        "ST_Multi(ST_Subdivide(geom, %s)) AS geom FROM {staging}".format(**tables), [max_vertices])
+    cursor.execute("ANALYZE {staging}".format(**tables))
+
+
+def swap_in_staged_districts(cursor, tables, min_overlap):
+    """Replace districts with staged ones in the current transaction, links of warnings (live and archived)
+    to removed districts are moved to staged districts covering at least min_overlap of the smaller of both areas"""
+    result = DistrictSwapResult()
+    cursor.execute(
+        "SELECT district_code FROM {districts} WHERE district_code NOT IN "
+        "(SELECT district_code FROM {staging})".format(**tables))
+    result.removed = [row[0] for row in cursor.fetchall()]
+    if result.removed:
+        cursor.execute(
+            "SELECT old.district_code, new.district_code FROM {districts} old JOIN {staging} new "
+            "ON ST_Intersects(old.geom, new.geom) WHERE old.district_code = ANY(%s) "
+            "AND ST_Area(ST_Intersection(old.geom, new.geom)) > %s * LEAST(ST_Area(old.geom), ST_Area(new.geom))"
+            .format(**tables), [result.removed, min_overlap])
+        for old_code, new_code in cursor.fetchall():
+            result.remapped.setdefault(old_code, []).append(new_code)
+    cursor.execute(
+        "INSERT INTO {districts} ({columns}) SELECT {columns} FROM {staging} "
+        "ON CONFLICT (district_code) DO UPDATE SET {updates} WHERE ({current}) IS DISTINCT FROM ({excluded}) "
+        "RETURNING district_code, xmax = 0".format(**tables))
+    for district_code, inserted in cursor.fetchall():
+        (result.created if inserted else result.updated).append(district_code)
+    if result.remapped:
+        old_codes = [old for old, codes in result.remapped.items() for _ in codes]
+        new_codes = [new for codes in result.remapped.values() for new in codes]
+        cursor.execute(
+            "INSERT INTO {warning_districts} ({warning_fk}, {warning_district_fk}) "
+            "SELECT DISTINCT links.{warning_fk}, remap.new FROM {warning_districts} links "
+            "JOIN unnest(%s::text[], %s::text[]) AS remap(old, new) ON links.{warning_district_fk} = remap.old "
+            "ON CONFLICT DO NOTHING".format(**tables), [old_codes, new_codes])
+        cursor.execute(
+            "INSERT INTO {archive_districts} ({archive_fk}, {archive_district_fk}, valid_to) "
+            "SELECT DISTINCT links.{archive_fk}, remap.new, links.valid_to FROM {archive_districts} links "
+            "JOIN unnest(%s::text[], %s::text[]) AS remap(old, new) ON links.{archive_district_fk} = remap.old "
+            "ON CONFLICT DO NOTHING".format(**tables), [old_codes, new_codes])
+    for removed_code in set(result.removed) - set(result.remapped):
+        logger.error("District {} was removed without successor, its warning links are dropped".format(removed_code))
+    changed = result.updated + result.removed
+    if result.removed:
+        cursor.execute("DELETE FROM {warning_districts} WHERE {warning_district_fk} = ANY(%s)".format(**tables),
+                       [result.removed])
+        cursor.execute("DELETE FROM {archive_districts} WHERE {archive_district_fk} = ANY(%s)".format(**tables),
+                       [result.removed])
+    if changed:
+        cursor.execute("DELETE FROM {parts} WHERE district_id = ANY(%s)".format(**tables), [changed])
+    if result.removed:
+        cursor.execute("DELETE FROM {districts} WHERE district_code = ANY(%s)".format(**tables), [result.removed])
+    if result.created or result.updated:
+        cursor.execute(
+            "INSERT INTO {parts} (district_id, geom) SELECT district_id, geom FROM {staging_parts} "
+            "WHERE district_id = ANY(%s)".format(**tables), [result.created + result.updated])
+    return result
+
+
+def swap_districts(districts, max_vertices=None, min_overlap=None):
+    """Replace all districts with new version of the dataset. Districts are staged and subdivided first,
+    then created, changed and removed districts are swapped in one short transaction, readers keep
+    seeing the previous version until it commits. Returns DistrictSwapResult."""
+    max_vertices = max_vertices or settings.DISTRICT_SUBDIVIDE_MAX_VERTICES
+    min_overlap = settings.DISTRICT_REMAP_MIN_OVERLAP if min_overlap is None else min_overlap
+    tables = _swap_tables()
+    with connection.cursor() as cursor:
+        try:
+            with transaction.atomic():
+                stage_districts(cursor, tables, districts, max_vertices)
+            with transaction.atomic():
+                return swap_in_staged_districts(cursor, tables, min_overlap)
+        finally:
+            cursor.execute("DROP TABLE IF EXISTS {staging}, {staging_parts}".format(**tables))
+
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "satagro:warnings:"
+
+_client = None
+
+
+def _channel(district_code):
+    return "{}{}".format(CHANNEL_PREFIX, district_code)
+
+
+def publish_district_changes(snapshots, event):
+    """Publish fresh district snapshots to subscribers of districts, event is 'updated' or 'archived'"""
+    global _client
+    if not snapshots:
+        return
+    try:
+        if _client is None:
+            _client = redis.Redis.from_url(settings.WARNINGS_EVENTS_REDIS_URL)
+        pipeline = _client.pipeline(transaction=False)
+        for district_code, snapshot in snapshots.items():
+            pipeline.publish(_channel(district_code), json.dumps({"event": event, "data": snapshot["data"]}))
+        pipeline.execute()
+    except redis.RedisError as e:
+        logger.error("Could not publish district changes: {}".format(e))
+
+
+class WarningsBroadcaster:
+    """Single Redis subscription per process, messages are fanned out to in-memory queues of connected clients"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._task = None
+
+    def subscribe(self, district_codes):
+        queue = asyncio.Queue(maxsize=settings.SSE_QUEUE_SIZE)
+        for district_code in district_codes:
+            self._subscribers[district_code].add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+        return queue
+
+    def unsubscribe(self, district_codes, queue):
+        for district_code in district_codes:
+            self._subscribers[district_code].discard(queue)
+            if not self._subscribers[district_code]:
+                del self._subscribers[district_code]
+
+    def _dispatch(self, channel, data):
+        district_code = channel[len(CHANNEL_PREFIX):]
+        for queue in self._subscribers.get(district_code, ()):
+            if queue.full():
+                # slow client, drop the oldest message
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+    async def _listen(self):
+        while True:
+            client = redis.asyncio.Redis.from_url(settings.WARNINGS_EVENTS_REDIS_URL, decode_responses=True)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe("{}*".format(CHANNEL_PREFIX))
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except redis.RedisError as e:
+                logger.error("Warnings subscription failed: {}".format(e))
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+
+broadcaster = WarningsBroadcaster()
+
+
+def format_event(message, lon=None, lat=None):
+    """Format published message as Server-Sent Event, coordinates of subscribed point are spliced into data"""
+    payload = json.loads(message)
+    data = payload["data"]
+    if lon is not None:
+        data["lon"] = lon
+        data["lat"] = lat
+    return "event: {}\ndata: {}\n\n".format(payload["event"], json.dumps(data, ensure_ascii=False))
+
+
+async def district_events(district_codes, lon=None, lat=None):
+    """Async generator of Server-Sent Events for given districts, sends comment as keep-alive when idle"""
+    queue = broadcaster.subscribe(district_codes)
+    try:
+        yield ": subscribed to {}\n\n".format(",".join(district_codes))
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=settings.SSE_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(message, lon, lat)
+    finally:
+        broadcaster.unsubscribe(district_codes, queue)
@@ -0,0 +1,106 @@
+import json
+
+from django.conf import settings
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import AsGeoJSON
+from django.db.models import F, Func, Value
+from django.utils import timezone
+
+from satagro.models import MeteoWarning
+
+EXPORT_FORMATS = ("geojson", "ndjson")
+
+WARNING_PROPERTIES = {
+    "id": "meteowarning_id",
+    "name_of_event": "meteowarning__name_of_event",
+    "grade": "meteowarning__grade",
+    "probability": "meteowarning__probability",
+    "valid_from": "meteowarning__valid_from",
+    "valid_to": "meteowarning__valid_to",
+    "published": "meteowarning__published",
+    "content": "meteowarning__content",
+    "comment": "meteowarning__comment",
+    "office": "meteowarning__office",
+    "district_code": "district_id",
+    "district_name": "district__name",
+}
+
+
+def export_queryset(simplify=None):
+    """Active warnings joined with their districts, one row per warning and district"""
+    geom = F("district__geom")
+    if simplify:
+        geom = Func(geom, Value(simplify), function="ST_SimplifyPreserveTopology", output_field=GeometryField(srid=4326))
+    return MeteoWarning.districts.through.objects.filter(
+        meteowarning__valid_to__gte=timezone.now()
+    ).values(
+        *WARNING_PROPERTIES.values()
+    ).annotate(
+        geometry=AsGeoJSON(geom)
+    ).order_by(
+        "meteowarning__valid_from", "meteowarning_id", "district_id"
+    )
+
+
+def export_rows(simplify=None):
+    """Iterate over exported rows with a server-side cursor"""
+    return export_queryset(simplify).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def aexport_rows(simplify=None):
+    """Iterate asynchronously over exported rows, every chunk of server-side cursor is fetched in worker thread"""
+    return export_queryset(simplify).aiterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def feature(row):
+    """GeoJSON Feature of exported row, geometry is already serialized by database"""
+    properties = {}
+    for name, column in WARNING_PROPERTIES.items():
+        value = row[column]
+        properties[name] = value.isoformat() if hasattr(value, "isoformat") else value
+    return '{{"type": "Feature", "geometry": {}, "properties": {}}}'.format(
+        row["geometry"], json.dumps(properties, ensure_ascii=False))
+
+
+def ndjson_chunks(rows):
+    """Stream features as newline delimited JSON"""
+    for row in rows:
+        yield feature(row) + "\n"
+
+
+def geojson_chunks(rows):
+    """Stream features as GeoJSON FeatureCollection"""
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ""
+    for row in rows:
+        yield separator + feature(row)
+        separator = ",\n"
+    yield "\n]}\n"
+
+
+async def ndjson_achunks(rows):
+    """Stream features from async iterator as newline delimited JSON"""
+    async for row in rows:
+        yield feature(row) + "\n"
+
+
+async def geojson_achunks(rows):
+    """Stream features from async iterator as GeoJSON FeatureCollection"""
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ""
+    async for row in rows:
+        yield separator + feature(row)
+        separator = ",\n"
+    yield "\n]}\n"
+
+
+def export_chunks(export_format, simplify=None):
+    """Stream active warnings in given format"""
+    rows = export_rows(simplify)
+    return ndjson_chunks(rows) if export_format == "ndjson" else geojson_chunks(rows)
+
+
+def aexport_chunks(export_format, simplify=None):
+    """Stream active warnings in given format without blocking event loop, for ASGI responses"""
+    rows = aexport_rows(simplify)
+    return ndjson_achunks(rows) if export_format == "ndjson" else geojson_achunks(rows)
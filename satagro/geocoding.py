@@ -0,0 +1,222 @@
+import csv
+import heapq
+import logging
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from satagro.district_index import DistrictIndex
+from satagro.models import District, MeteoWarning, MeteoWarningArchiveDistrict, Voivodeship
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_COLUMNS = ["district_code", "warnings"]
+
+# district index of pool worker, built once by _init_worker
+_worker_index = None
+
+# observation times of one chunk are covered by at most this many time ranges when warnings are loaded,
+# the widest gaps between observations are left out
+MAX_TIME_RANGES = 32
+
+
+def read_csv_chunks(f, chunk_size, delimiter=","):
+    """Return columns of CSV file object and generator of its rows (lists of strings) in chunks"""
+    reader = csv.reader(f, delimiter=delimiter)
+    columns = next(reader)
+
+    def chunks():
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    return columns, chunks()
+
+
+def read_parquet_chunks(file_path, chunk_size):
+    """Return columns of Parquet file and generator of its rows in record batches, needs optional pyarrow package"""
+    import pyarrow.parquet
+
+    parquet_file = pyarrow.parquet.ParquetFile(file_path)
+    columns = parquet_file.schema_arrow.names
+
+    def chunks():
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            values = [batch.column(i).to_pylist() for i in range(len(columns))]
+            yield [list(row) for row in zip(*values)]
+
+    return columns, chunks()
+
+
+def parse_observation_time(value):
+    """Parse ISO datetime of observation, naive values are in TIME_ZONE, returns None when it is not a datetime"""
+    if value is None or hasattr(value, "tzinfo"):
+        parsed = value
+    else:
+        try:
+            parsed = parse_datetime(str(value))
+        except ValueError:
+            return None
+    if parsed is None:
+        return None
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def load_geometries():
+    """WKB geometries of districts and voivodeships, pool workers build their own index from them"""
+    districts = [(code, bytes(geom.wkb)) for code, geom in District.objects.values_list("district_code", "geom").iterator()]
+    voivodeships = [(code, bytes(geom.wkb)) for code, geom in Voivodeship.objects.values_list("code", "geom")]
+    return districts, voivodeships
+
+
+def build_index(districts, voivodeships):
+    return DistrictIndex([(code, GEOSGeometry(memoryview(wkb), srid=4326)) for code, wkb in districts],
+                         [(code, GEOSGeometry(memoryview(wkb), srid=4326)) for code, wkb in voivodeships])
+
+
+def _init_worker(districts, voivodeships):
+    global _worker_index
+    _worker_index = build_index(districts, voivodeships)
+
+
+def _resolve_chunk(coordinates):
+    return resolve_coordinates(_worker_index, coordinates)
+
+
+def resolve_coordinates(index, coordinates):
+    """District codes of (lon, lat) pairs, None for points outside of districts or with invalid coordinates.
+    Every point is one lookup in the index, bounding boxes reject most candidates before GEOS is called."""
+    lookup = index.lookup_xy
+    codes = []
+    for lon, lat in coordinates:
+        codes.append(None if lon is None or lat is None else lookup(lon, lat))
+    return codes
+
+
+def time_ranges(moments, max_ranges=MAX_TIME_RANGES):
+    """Cover moments with at most max_ranges sorted (start, end) ranges, split at the widest gaps between them"""
+    moments = sorted(set(moments))
+    gaps = sorted(range(1, len(moments)), key=lambda i: moments[i] - moments[i - 1], reverse=True)[:max_ranges - 1]
+    ranges, start = [], moments[0]
+    for i in sorted(gaps):
+        ranges.append((start, moments[i - 1]))
+        start = moments[i]
+    ranges.append((start, moments[-1]))
+    return ranges
+
+
+class WarningWindows:
+    """Validity windows of live and archived warnings of given districts, loaded only for time ranges of one chunk"""
+
+    def __init__(self, ranges, district_codes):
+        self._windows = defaultdict(list)
+        live_overlaps, archived_overlaps = Q(), Q()
+        for start, end in ranges:
+            live_overlaps |= ((Q(meteowarning__valid_from__lte=end) | Q(meteowarning__valid_from__isnull=True))
+                              & Q(meteowarning__valid_to__gte=start))
+            archived_overlaps |= ((Q(meteowarningarchive__valid_from__lte=end)
+                                   | Q(meteowarningarchive__valid_from__isnull=True)) & Q(valid_to__gte=start))
+        first = ranges[0][0]
+        live = MeteoWarning.districts.through.objects.filter(
+            live_overlaps, district_id__in=list(district_codes),
+        ).values_list("district_id", "meteowarning_id", "meteowarning__valid_from", "meteowarning__valid_to")
+        # valid_to of links and of archive prunes both partitioned tables to months of the chunk
+        archived = MeteoWarningArchiveDistrict.objects.filter(
+            archived_overlaps, district_id__in=list(district_codes),
+            valid_to__gte=first, meteowarningarchive__valid_to__gte=first,
+        ).values_list("district_id", "meteowarningarchive_id", "meteowarningarchive__valid_from", "valid_to")
+        for rows in (live, archived):
+            for district_code, warning_id, valid_from, valid_to in rows.iterator(chunk_size=5000):
+                self._windows[district_code].append((valid_from or first, valid_to, warning_id))
+        for windows in self._windows.values():
+            windows.sort()
+
+    def active(self, district_code, moments):
+        """Ids of warnings of district valid at each of sorted moments, windows are swept once for all of them"""
+        windows = self._windows.get(district_code, [])
+        started = []  # (valid_to, warning_id) of windows starting before current moment
+        position = 0
+        result = []
+        for moment in moments:
+            while position < len(windows) and windows[position][0] <= moment:
+                heapq.heappush(started, windows[position][1:])
+                position += 1
+            while started and started[0][0] < moment:
+                heapq.heappop(started)
+            result.append(sorted({warning_id for _, warning_id in started}))
+        return result
+
+
+def _coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def geocode_chunks(columns, chunks, lon_column, lat_column, time_column=None, workers=None):
+    """Resolve chunks of rows to district codes across a process pool and join warnings active at observation time.
+    Yields rows with district_code and warnings (ids joined by ';') appended, in input order."""
+    workers = workers or multiprocessing.cpu_count()
+    lon_index, lat_index = columns.index(lon_column), columns.index(lat_column)
+    time_index = columns.index(time_column) if time_column else None
+    districts, voivodeships = load_geometries()
+
+    def coordinates(rows):
+        return [(_coordinate(row[lon_index]), _coordinate(row[lat_index])) for row in rows]
+
+    def finish(rows, codes):
+        moments = [parse_observation_time(row[time_index]) for row in rows] if time_column else [None] * len(rows)
+        points = defaultdict(list)
+        for i, (moment, district_code) in enumerate(zip(moments, codes)):
+            if moment is not None and district_code is not None:
+                points[district_code].append((moment, i))
+        warnings = [[] for _ in rows]
+        if points:
+            windows = WarningWindows(time_ranges(moment for found in points.values() for moment, _ in found), points)
+            for district_code, found in points.items():
+                found.sort()
+                for (_, i), active in zip(found, windows.active(district_code, [moment for moment, _ in found])):
+                    warnings[i] = active
+        for row, district_code, active in zip(rows, codes, warnings):
+            yield row + [district_code or "", ";".join(active)]
+
+    if workers <= 1 or multiprocessing.current_process().daemon:
+        index = build_index(districts, voivodeships)
+        for rows in chunks:
+            yield from finish(rows, resolve_coordinates(index, coordinates(rows)))
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(districts, voivodeships)) as executor:
+        for rows in chunks:
+            # keep only a few chunks in flight, input is never read into memory at once
+            pending.append((rows, executor.submit(_resolve_chunk, coordinates(rows))))
+            if len(pending) >= workers * 2:
+                rows, future = pending.popleft()
+                yield from finish(rows, future.result())
+        while pending:
+            rows, future = pending.popleft()
+            yield from finish(rows, future.result())
+
+
+def write_csv(rows, columns, output, delimiter=","):
+    """Stream geocoded rows to output file object, returns number of written rows"""
+    writer = csv.writer(output, delimiter=delimiter)
+    writer.writerow(list(columns) + OUTPUT_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
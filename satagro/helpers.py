@@ -1,52 +1,76 @@
+import hashlib
 import logging
+import threading
 
 import requests
+from django.conf import settings
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from satagro.cache import get_feed_state
 
 logger = logging.getLogger(__name__)
 
+_session_local = threading.local()
+
 
 def parse_safe_datetime(val):
-    """Parse safe datetime string"""
+    """Parse safe datetime string, naive values are in TIME_ZONE"""
     try:
-        result = timezone.make_aware(parse_datetime(val))
-        return result
-    except (TypeError, AttributeError):
+        result = parse_datetime(val)
+        return timezone.make_aware(result) if timezone.is_naive(result) else result
+    except (TypeError, AttributeError, ValueError):
         return None
+def get_session():
+    """Return requests session with pooled keep-alive connections, one per thread"""
+    session = getattr(_session_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504]))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session_local.session = session
+    return session
+
+
 def api_request(url):
     """Simple Api request"""
     try:
-        response = requests.get(url)
+        response = get_session().get(url, timeout=settings.API_REQUEST_TIMEOUT)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         logger.error("Request failed: {}".format(e))
         return None
 
-def warning_has_changed(existing_warning, event) -> bool:
-    """Compare data if smth was updated"""
-    name_of_event = event.get("nazwa_zdarzenia")
-    grade = event.get("stopien")
-    probability = event.get("prawdopodobienstwo")
-    valid_from = parse_safe_datetime(event.get("obowiazuje_od"))
-    valid_to = parse_safe_datetime(event.get("obowiazuje_do"))
-    published = parse_safe_datetime(event.get("opublikowano"))
-    content = event.get("tresc", "")
-    comment = event.get("komentarz", "")
-    office = event.get("biuro", "")
-
-    current_districts = set(existing_warning.districts.values_list('district_code', flat=True))
-    new_districts = set(event.get("teryt", []))
-    return (
-        existing_warning.name_of_event != name_of_event or
-        existing_warning.grade != grade or
-        existing_warning.probability != probability or
-        existing_warning.valid_from != valid_from or
-        existing_warning.valid_to != valid_to or
-        existing_warning.published != published or
-        existing_warning.content != content or
-        existing_warning.comment != comment or
-        existing_warning.office != office or
-        current_districts != new_districts
-    )
+
+def fetch_feed(url):
+    """Conditional Api request, returns (payload, feed state) or (None, None) when feed did not change or request failed.
+    Feed state should be saved with save_feed_state after payload was processed."""
+    state = get_feed_state(url) or {}
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    try:
+        response = get_session().get(url, headers=headers, timeout=settings.API_REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            logger.info("Feed {} not modified".format(url))
+            return None, None
+        response.raise_for_status()
+        sha256 = hashlib.sha256(response.content).hexdigest()
+        if sha256 == state.get("sha256"):
+            logger.info("Feed {} content did not change".format(url))
+            return None, None
+        new_state = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": sha256,
+        }
+        return response.json(), new_state
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error("Request failed: {}".format(e))
+        return None, None
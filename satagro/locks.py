@@ -0,0 +1,141 @@
+import functools
+import logging
+import threading
+import uuid
+
+import redis
+from django.conf import settings
+
+from satagro.metrics import TASK_LOCK_EVENTS
+
+logger = logging.getLogger(__name__)
+
+LOCK_PREFIX = "satagro:lock:"
+PENDING_PREFIX = "satagro:lock_pending:"
+
+SKIP = "skip"
+COALESCE = "coalesce"
+
+# Lease is extended or released only by the owner of the lock (token stored as its value)
+_RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.TASK_LOCKS_REDIS_URL)
+    return _client
+
+
+class TaskLock:
+    """Redis lock with lease, renewed by background thread while owner is alive. Lease expires on its own
+    when worker process dies, so crashed run never blocks the task for longer than TASK_LOCK_LEASE seconds."""
+
+    def __init__(self, name, lease=None, client=None):
+        self.name = name
+        self.key = LOCK_PREFIX + name
+        self.lease = lease or settings.TASK_LOCK_LEASE
+        self.client = client or get_client()
+        self.token = uuid.uuid4().hex
+        self.lost = False
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def acquire(self):
+        if not self.client.set(self.key, self.token, nx=True, px=int(self.lease * 1000)):
+            return False
+        self._stop.clear()
+        self._renewer = threading.Thread(target=self._renew, name="lease-{}".format(self.name), daemon=True)
+        self._renewer.start()
+        return True
+
+    def _renew(self):
+        while not self._stop.wait(self.lease / 3):
+            try:
+                renewed = self.client.eval(_RENEW_SCRIPT, 1, self.key, self.token, int(self.lease * 1000))
+            except redis.RedisError as e:
+                logger.error("Could not renew lock {}: {}".format(self.name, e))
+                continue
+            if not renewed:
+                self.lost = True
+                TASK_LOCK_EVENTS.labels(self.name, "lost").inc()
+                logger.error("Lock {} expired before task finished".format(self.name))
+                return
+
+    def release(self):
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join()
+            self._renewer = None
+        try:
+            self.client.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+        except redis.RedisError as e:
+            logger.error("Could not release lock {}: {}".format(self.name, e))
+
+
+def _request_rerun(client, name):
+    try:
+        client.set(PENDING_PREFIX + name, 1, ex=int(settings.TASK_LOCK_LEASE))
+    except redis.RedisError as e:
+        logger.error("Could not coalesce run of {}: {}".format(name, e))
+
+
+def _take_rerun(client, name):
+    try:
+        return client.delete(PENDING_PREFIX + name) > 0
+    except redis.RedisError as e:
+        logger.error("Could not check pending run of {}: {}".format(name, e))
+        return False
+
+
+def singleton_task(name, policy=SKIP):
+    """Decorator running task function in at most one worker at a time. When the task is already running
+    the call is skipped, with COALESCE policy it also asks the running call to repeat once after it finishes,
+    so any number of overlapping triggers results in a single extra run."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not getattr(settings, "TASK_LOCKS_ENABLED", True):
+                return func(*args, **kwargs)
+            lock = TaskLock(name)
+            try:
+                acquired = lock.acquire()
+            except redis.RedisError as e:
+                # broker lives on the same Redis, running without lock is better than not running at all
+                logger.error("Could not acquire lock {}, running without it: {}".format(name, e))
+                return func(*args, **kwargs)
+            if not acquired:
+                if policy == COALESCE:
+                    _request_rerun(lock.client, name)
+                    TASK_LOCK_EVENTS.labels(name, "coalesced").inc()
+                else:
+                    TASK_LOCK_EVENTS.labels(name, "skipped").inc()
+                logger.info("{} is already running, {} this run".format(
+                    name, "coalesced" if policy == COALESCE else "skipped"))
+                return None
+            try:
+                if policy == COALESCE:
+                    # stale request of previous owner is dropped, this run covers it
+                    _take_rerun(lock.client, name)
+                result = func(*args, **kwargs)
+                while policy == COALESCE and not lock.lost and _take_rerun(lock.client, name):
+                    TASK_LOCK_EVENTS.labels(name, "rerun").inc()
+                    result = func(*args, **kwargs)
+                return result
+            finally:
+                lock.release()
+        return wrapper
+    return decorator
@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from satagro.partitions import detach_archive_partitions
+
+
+class Command(BaseCommand):
+    help = ("Detach monthly partitions of archived warnings older than given month. Detached tables can be "
+            "dumped with pg_dump (compressed custom format) and dropped, or dropped right away with --drop")
+
+    def add_arguments(self, parser):
+        parser.add_argument("before", help="First month which stays attached, in format YYYY-MM")
+        parser.add_argument("--drop", action="store_true", help="Drop partitions after detaching them")
+
+    def handle(self, *args, **options):
+        try:
+            before = datetime.strptime(options["before"], "%Y-%m").replace(tzinfo=timezone.utc)
+        except ValueError:
+            raise CommandError("before must be a month in format YYYY-MM")
+        for name in detach_archive_partitions(before, drop=options["drop"]):
+            self.stdout.write(name)
@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from satagro.export import EXPORT_FORMATS, export_chunks
+
+
+class Command(BaseCommand):
+    help = "Stream active meteo warnings with geometry of their districts as GeoJSON or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="geojson")
+        parser.add_argument("--simplify", type=float, default=None,
+                            help="Simplification tolerance of district geometry in degrees")
+        parser.add_argument("--output", default="-", help="Output file, '-' means standard output")
+
+    def handle(self, *args, **options):
+        output = sys.stdout if options["output"] == "-" else open(options["output"], "w", encoding="utf-8")
+        try:
+            for chunk in export_chunks(options["format"], options["simplify"]):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
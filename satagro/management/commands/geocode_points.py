@@ -0,0 +1,53 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from satagro.geocoding import geocode_chunks, read_csv_chunks, read_parquet_chunks, write_csv
+
+
+class Command(BaseCommand):
+    help = ("Tag coordinates from CSV (or Parquet, needs pyarrow) file with TERYT district codes and ids of meteo "
+            "warnings (live and archived) active at observation time, output is streamed as CSV")
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="CSV or Parquet file with coordinates")
+        parser.add_argument("--output", default="-", help="Output CSV file, '-' means standard output")
+        parser.add_argument("--lon-column", default="lon")
+        parser.add_argument("--lat-column", default="lat")
+        parser.add_argument("--time-column", default=None,
+                            help="Column with observation time (ISO format), warnings are joined only when given")
+        parser.add_argument("--delimiter", default=",")
+        parser.add_argument("--chunk-size", type=int, default=50000, help="Number of rows resolved by one worker task")
+        parser.add_argument("--workers", type=int, default=None, help="Number of processes, defaults to number of CPUs")
+
+    def handle(self, *args, **options):
+        input_file = None
+        if options["input"].endswith(".parquet"):
+            try:
+                columns, chunks = read_parquet_chunks(options["input"], options["chunk_size"])
+            except ImportError:
+                raise CommandError("Reading Parquet files requires pyarrow package")
+        else:
+            input_file = open(options["input"], newline="", encoding="utf-8")
+            columns, chunks = read_csv_chunks(input_file, options["chunk_size"], options["delimiter"])
+        output = None
+        started = time.monotonic()
+        try:
+            for column in (options["lon_column"], options["lat_column"], options["time_column"]):
+                if column and column not in columns:
+                    raise CommandError("Column {} not found in input, available columns: {}".format(
+                        column, ", ".join(columns)))
+            output = sys.stdout if options["output"] == "-" else open(options["output"], "w", newline="",
+                                                                     encoding="utf-8")
+            rows = geocode_chunks(columns, chunks, options["lon_column"], options["lat_column"],
+                                  options["time_column"], options["workers"])
+            count = write_csv(rows, columns, output, options["delimiter"])
+        finally:
+            if output is not None and output is not sys.stdout:
+                output.close()
+            if input_file is not None:
+                input_file.close()
+        elapsed = time.monotonic() - started
+        self.stderr.write("Geocoded {} points in {:.1f}s ({:.0f} points/s)".format(
+            count, elapsed, count / elapsed if elapsed else 0))
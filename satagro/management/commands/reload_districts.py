@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from satagro.tasks import reload_districts
+
+
+class Command(BaseCommand):
+    help = ("Replace districts with new version of Geoportal districts file while API keeps serving the previous "
+            "version, warnings of removed districts are linked to districts replacing them")
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", nargs="?", default="./pgr.gml", help="Geoportal districts file (GML)")
+        parser.add_argument("--background", action="store_true", help="Run reload in celery worker")
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            result = reload_districts.delay(options["file"])
+            self.stdout.write("Reload queued as task {}".format(result.id))
+            return
+        result = reload_districts(options["file"])
+        if result is None:
+            raise CommandError("Districts were not reloaded, see log for details")
+        self.stdout.write("Created {created}, updated {updated}, removed {removed} districts".format(**result))
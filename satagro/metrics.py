@@ -0,0 +1,93 @@
+import functools
+import glob
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+                               multiprocess)
+
+# With PROMETHEUS_MULTIPROC_DIR set every process writes its samples to files in that directory and /metrics
+# aggregates them. Every service (django, celery) has its own directory, wiped when the service starts, under
+# shared PROMETHEUS_METRICS_ROOT and /metrics aggregates files of all of them.
+
+API_STAGE_SECONDS = Histogram(
+    "satagro_api_stage_seconds", "Duration of stages of API requests", ["view", "stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+TASK_DURATION_SECONDS = Histogram(
+    "satagro_task_duration_seconds", "Duration of celery tasks", ["task"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+FEED_FETCH_SECONDS = Histogram(
+    "satagro_feed_fetch_seconds", "Duration of IMGW warnings feed download",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20),
+)
+TASK_ROWS = Counter("satagro_task_rows", "Rows processed by celery tasks", ["task", "action"])
+TASK_LOCK_EVENTS = Counter(
+    "satagro_task_lock_events", "Runs of singleton tasks skipped or coalesced while task was running, "
+    "reruns of coalesced tasks and leases lost before task finished", ["task", "event"],
+)
+INGEST_LAG_SECONDS = Histogram(
+    "satagro_ingest_lag_seconds", "Time between publication of warning by IMGW and storing it",
+    buckets=(10, 30, 60, 120, 300, 600, 1800, 3600, 3 * 3600, 6 * 3600, 24 * 3600),
+)
+
+
+@contextmanager
+def observe_stage(view, stage):
+    """Record duration of block as stage of API request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        API_STAGE_SECONDS.labels(view, stage).observe(time.perf_counter() - start)
+
+
+def track_task(task_name):
+    """Decorator recording duration of task function"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with TASK_DURATION_SECONDS.labels(task_name).time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_rows(task_name, **counts):
+    """Add numbers of processed rows by action, e.g. count_rows("get_meteo_warnings", created=2)"""
+    for action, count in counts.items():
+        if count:
+            TASK_ROWS.labels(task_name, action).inc(count)
+
+
+def observe_ingest_lag(published, stored_at):
+    """Record delay between publication and storing of warnings, warnings without publication date are skipped"""
+    for value in published:
+        if value is not None:
+            INGEST_LAG_SECONDS.observe(max(0.0, (stored_at - value).total_seconds()))
+
+
+class ServicesCollector:
+    """Merge samples written by processes of all services into subdirectories of root directory"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def collect(self):
+        files = glob.glob(os.path.join(self.root, "*", "*.db"))
+        return multiprocess.MultiProcessCollector.merge(files, accumulate=True)
+
+
+def render_metrics():
+    """Return metrics in Prometheus text format and its content type, aggregated across processes in multiprocess mode"""
+    if os.environ.get("PROMETHEUS_METRICS_ROOT"):
+        registry = CollectorRegistry()
+        registry.register(ServicesCollector(os.environ["PROMETHEUS_METRICS_ROOT"]))
+    elif os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
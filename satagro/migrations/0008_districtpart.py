@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:11
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_district_parts(apps, schema_editor):
+    # same code as district imports, so parts follow DISTRICT_SUBDIVIDE_MAX_VERTICES
+    from satagro.districts import refresh_district_parts
+    refresh_district_parts()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satagro', '0007_districtdataset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistrictPart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom', django.contrib.gis.db.models.fields.MultiPolygonField(srid=4326)),
+                ('district', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parts', to='satagro.district')),
+            ],
+        ),
+        migrations.RunPython(backfill_district_parts, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satagro', '0008_districtpart'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='meteowarningarchive',
+            index=models.Index(fields=['-valid_to', '-id'], name='satagro_met_valid_t_f776ec_idx'),
+        ),
+    ]
@@ -0,0 +1,148 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Archive and its district links are range partitioned by valid_to month. Partitioned tables require the
+# partition key in primary key, so the archive primary key becomes (id, valid_to) and links carry valid_to
+# of their warning. Monthly partitions are created by satagro.tasks.create_meteo_warning_archive_partitions,
+# rows outside of existing partitions land in DEFAULT partitions. id alone is no longer unique in the database,
+# archive_expired_warnings replaces row of warning archived again with different valid_to.
+# Archived warnings without valid_to can not be placed in any partition, migration stops when there are any.
+PARTITION_ARCHIVE = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM satagro_meteowarningarchive WHERE valid_to IS NULL) THEN
+        RAISE EXCEPTION 'Archived warnings without valid_to can not be partitioned, set their valid_to first: %',
+            (SELECT string_agg(id, ', ') FROM satagro_meteowarningarchive WHERE valid_to IS NULL);
+    END IF;
+END $$;
+
+CREATE TABLE satagro_meteowarningarchive_new (
+    id varchar(100) NOT NULL,
+    name_of_event varchar(100) NOT NULL,
+    grade varchar(3) NOT NULL,
+    probability varchar(3) NOT NULL,
+    valid_from timestamp with time zone NULL,
+    valid_to timestamp with time zone NOT NULL,
+    published timestamp with time zone NULL,
+    content text NOT NULL,
+    comment text NOT NULL,
+    office varchar(255) NOT NULL,
+    PRIMARY KEY (id, valid_to)
+) PARTITION BY RANGE (valid_to);
+CREATE TABLE satagro_meteowarningarchive_default PARTITION OF satagro_meteowarningarchive_new DEFAULT;
+
+CREATE TABLE satagro_meteowarningarchive_districts_new (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    meteowarningarchive_id varchar(100) NOT NULL,
+    district_id varchar(4) NOT NULL
+        REFERENCES satagro_district (district_code) DEFERRABLE INITIALLY DEFERRED,
+    valid_to timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, valid_to),
+    UNIQUE (meteowarningarchive_id, district_id, valid_to)
+) PARTITION BY RANGE (valid_to);
+CREATE TABLE satagro_meteowarningarchive_districts_default
+    PARTITION OF satagro_meteowarningarchive_districts_new DEFAULT;
+
+INSERT INTO satagro_meteowarningarchive_new
+    (id, name_of_event, grade, probability, valid_from, valid_to, published, content, comment, office)
+SELECT id, name_of_event, grade, probability, valid_from, valid_to, published, content, comment, office
+FROM satagro_meteowarningarchive;
+INSERT INTO satagro_meteowarningarchive_districts_new (meteowarningarchive_id, district_id, valid_to)
+SELECT link.meteowarningarchive_id, link.district_id, archive.valid_to
+FROM satagro_meteowarningarchive_districts link
+JOIN satagro_meteowarningarchive archive ON archive.id = link.meteowarningarchive_id;
+
+DROP TABLE satagro_meteowarningarchive_districts;
+DROP TABLE satagro_meteowarningarchive;
+ALTER TABLE satagro_meteowarningarchive_new RENAME TO satagro_meteowarningarchive;
+ALTER TABLE satagro_meteowarningarchive_districts_new RENAME TO satagro_meteowarningarchive_districts;
+
+CREATE INDEX satagro_met_valid_t_d1d402_idx ON satagro_meteowarningarchive (valid_to DESC);
+CREATE INDEX satagro_met_publish_4d972d_idx ON satagro_meteowarningarchive (published DESC);
+CREATE INDEX satagro_met_valid_t_f776ec_idx ON satagro_meteowarningarchive (valid_to DESC, id DESC);
+CREATE INDEX satagro_meteowarningarchive_districts_archive_idx
+    ON satagro_meteowarningarchive_districts (meteowarningarchive_id);
+CREATE INDEX satagro_meteowarningarchive_districts_district_idx
+    ON satagro_meteowarningarchive_districts (district_id, valid_to);
+"""
+
+UNPARTITION_ARCHIVE = """
+CREATE TABLE satagro_meteowarningarchive_old (
+    id varchar(100) NOT NULL PRIMARY KEY,
+    name_of_event varchar(100) NOT NULL,
+    grade varchar(3) NOT NULL,
+    probability varchar(3) NOT NULL,
+    valid_from timestamp with time zone NULL,
+    valid_to timestamp with time zone NULL,
+    published timestamp with time zone NULL,
+    content text NOT NULL,
+    comment text NOT NULL,
+    office varchar(255) NOT NULL
+);
+CREATE TABLE satagro_meteowarningarchive_districts_old (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    meteowarningarchive_id varchar(100) NOT NULL
+        REFERENCES satagro_meteowarningarchive_old (id) DEFERRABLE INITIALLY DEFERRED,
+    district_id varchar(4) NOT NULL
+        REFERENCES satagro_district (district_code) DEFERRABLE INITIALLY DEFERRED,
+    UNIQUE (meteowarningarchive_id, district_id)
+);
+INSERT INTO satagro_meteowarningarchive_old
+SELECT DISTINCT ON (id) id, name_of_event, grade, probability, valid_from, valid_to, published, content, comment, office
+FROM satagro_meteowarningarchive ORDER BY id, valid_to DESC;
+INSERT INTO satagro_meteowarningarchive_districts_old (meteowarningarchive_id, district_id)
+SELECT DISTINCT meteowarningarchive_id, district_id FROM satagro_meteowarningarchive_districts;
+
+DROP TABLE satagro_meteowarningarchive_districts;
+DROP TABLE satagro_meteowarningarchive;
+ALTER TABLE satagro_meteowarningarchive_old RENAME TO satagro_meteowarningarchive;
+ALTER TABLE satagro_meteowarningarchive_districts_old RENAME TO satagro_meteowarningarchive_districts;
+
+CREATE INDEX satagro_met_valid_t_d1d402_idx ON satagro_meteowarningarchive (valid_to DESC);
+CREATE INDEX satagro_met_publish_4d972d_idx ON satagro_meteowarningarchive (published DESC);
+CREATE INDEX satagro_met_valid_t_f776ec_idx ON satagro_meteowarningarchive (valid_to DESC, id DESC);
+CREATE INDEX satagro_meteowarningarchive_districts_archive_idx
+    ON satagro_meteowarningarchive_districts (meteowarningarchive_id);
+CREATE INDEX satagro_meteowarningarchive_districts_district_idx
+    ON satagro_meteowarningarchive_districts (district_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satagro', '0009_meteowarningarchive_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION_ARCHIVE, reverse_sql=UNPARTITION_ARCHIVE),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='meteowarningarchive',
+                    name='valid_to',
+                    field=models.DateTimeField(),
+                ),
+                migrations.CreateModel(
+                    name='MeteoWarningArchiveDistrict',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('valid_to', models.DateTimeField()),
+                        ('district', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='satagro.district')),
+                        ('meteowarningarchive', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='satagro.meteowarningarchive')),
+                    ],
+                    options={
+                        'db_table': 'satagro_meteowarningarchive_districts',
+                        'unique_together': {('meteowarningarchive', 'district', 'valid_to')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='meteowarningarchive',
+                    name='districts',
+                    field=models.ManyToManyField(blank=True, through='satagro.MeteoWarningArchiveDistrict', to='satagro.district'),
+                ),
+            ],
+        ),
+    ]
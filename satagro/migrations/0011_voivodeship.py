@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:26
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satagro', '0010_partition_meteowarningarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Voivodeship',
+            fields=[
+                ('code', models.CharField(max_length=2, primary_key=True, serialize=False)),
+                ('geom', django.contrib.gis.db.models.fields.MultiPolygonField(srid=4326)),
+            ],
+        ),
+        migrations.RunSQL(
+            sql="INSERT INTO satagro_voivodeship (code, geom) "
+                "SELECT left(district_code, 2), ST_Multi(ST_CollectionExtract(ST_Union(geom), 3)) "
+                "FROM satagro_district GROUP BY left(district_code, 2)",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
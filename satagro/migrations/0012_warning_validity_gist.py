@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:29
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satagro', '0011_voivodeship'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='meteowarning',
+            index=django.contrib.postgres.indexes.GistIndex(models.Func(models.F('valid_from'), models.F('valid_to'), models.Value('[]'), function='tstzrange', output_field=django.contrib.postgres.fields.ranges.DateTimeRangeField()), name='satagro_warning_validity_gist'),
+        ),
+        migrations.AddIndex(
+            model_name='meteowarningarchive',
+            index=django.contrib.postgres.indexes.GistIndex(models.Func(models.F('valid_from'), models.F('valid_to'), models.Value('[]'), function='tstzrange', output_field=django.contrib.postgres.fields.ranges.DateTimeRangeField()), name='satagro_archive_validity_gist'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.contrib.gis.db.models import MultiPolygonField
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.contrib.postgres.indexes import GistIndex
 from django.core.validators import MinLengthValidator
 from django.db import models
+from django.db.models import F, Func, Value
 
 class District(models.Model):
     id = models.IntegerField() #JPT_ID
@@ -20,6 +23,38 @@ class District(models.Model):
         return "{} - {}".format(self.name, self.district_code)
 
 
+class DistrictPart(models.Model):
+    """Piece of district geometry with limited number of vertices (ST_Subdivide)"""
+    district = models.ForeignKey(District, on_delete=models.CASCADE, related_name="parts")
+    geom = MultiPolygonField(srid=4326, spatial_index=True)
+
+    def __str__(self):
+        return "{} - part {}".format(self.district_id, self.id)
+
+
+class Voivodeship(models.Model):
+    """Dissolved geometry of districts sharing the first two digits of TERYT code"""
+    code = models.CharField(max_length=2, primary_key=True)
+    geom = MultiPolygonField(srid=4326, spatial_index=True)
+
+    def __str__(self):
+        return self.code
+
+
+class DistrictDataset(models.Model):
+    source = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    imported_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{} - {}".format(self.source, self.sha256)
+
+
+def validity_range():
+    """Closed range [valid_from, valid_to] of warning, the same expression is indexed with GiST"""
+    return Func(F("valid_from"), F("valid_to"), Value("[]"), function="tstzrange", output_field=DateTimeRangeField())
+
+
 class MeteoWarning(models.Model):
     id = models.CharField(max_length=100, primary_key=True)
     name_of_event = models.CharField(max_length=100)
@@ -35,19 +70,26 @@ class MeteoWarning(models.Model):
     def __str__(self):
         return "{} - {}".format(self.name_of_event, self.id)
 
+    class Meta:
+        indexes = [
+            GistIndex(validity_range(), name="satagro_warning_validity_gist"),
+        ]
+
 
 class MeteoWarningArchive(models.Model):
+    # primary key in database is (id, valid_to) because of partitioning, uniqueness of id is kept by archiving code
     id = models.CharField(max_length=100, primary_key=True)
     name_of_event = models.CharField(max_length=100)
     grade = models.CharField(max_length=3)
     probability = models.CharField(max_length=3)
     valid_from = models.DateTimeField(null=True, default=None)
-    valid_to = models.DateTimeField(null=True, default=None)
+    # partition key of the archive table, primary key of partitioned table is (id, valid_to)
+    valid_to = models.DateTimeField()
     published = models.DateTimeField(null=True, default=None)
     content = models.TextField(blank=True)
     comment = models.TextField(blank=True)
     office = models.CharField(max_length=255, blank=True)
-    districts = models.ManyToManyField(District, blank=True)
+    districts = models.ManyToManyField(District, blank=True, through="MeteoWarningArchiveDistrict")
 
     def __str__(self):
         return "{} - {}".format(self.name_of_event, self.id)
@@ -56,8 +98,17 @@ class MeteoWarningArchive(models.Model):
         indexes = [
             models.Index(fields=['-valid_to']),
             models.Index(fields=['-published']),
+            models.Index(fields=['-valid_to', '-id']),
+            GistIndex(validity_range(), name="satagro_archive_validity_gist"),
         ]
 
 
+class MeteoWarningArchiveDistrict(models.Model):
+    """Link of archived warning with district, partitioned by valid_to of warning like the archive itself"""
+    meteowarningarchive = models.ForeignKey(MeteoWarningArchive, on_delete=models.CASCADE, db_constraint=False)
+    district = models.ForeignKey(District, on_delete=models.CASCADE)
+    valid_to = models.DateTimeField()
 
-
+    class Meta:
+        db_table = "satagro_meteowarningarchive_districts"
+        unique_together = [("meteowarningarchive", "district", "valid_to")]
@@ -0,0 +1,104 @@
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from satagro.models import MeteoWarningArchive, MeteoWarningArchiveDistrict
+
+logger = logging.getLogger(__name__)
+
+PARTITION_SUFFIX = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def partitioned_tables():
+    """Tables partitioned by valid_to month, links go first so they are never detached after their warnings"""
+    return [MeteoWarningArchiveDistrict._meta.db_table, MeteoWarningArchive._meta.db_table]
+
+
+def month_start(value):
+    """First moment (UTC) of month of given datetime"""
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, months):
+    """Shift first moment of month by given number of months"""
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return "{}_p{:%Y%m}".format(table, month)
+
+
+def list_partitions(cursor, table):
+    """Return {month: partition name} of monthly partitions attached to table"""
+    cursor.execute("SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                   "WHERE pg_inherits.inhparent = %s::regclass", [table])
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_SUFFIX.search(name)
+        if match and name.startswith(table):
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)] = name
+    return partitions
+
+
+def create_partition(cursor, table, month):
+    """Create partition of table for month, rows of that month are moved from DEFAULT partition before attaching"""
+    qn = connection.ops.quote_name
+    name, default = partition_name(table, month), "{}_default".format(table)
+    end = add_months(month, 1)
+    cursor.execute("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)".format(qn(name), qn(table)))
+    cursor.execute("WITH moved AS (DELETE FROM {} WHERE valid_to >= %s AND valid_to < %s RETURNING *) "
+                   "INSERT INTO {} SELECT * FROM moved".format(qn(default), qn(name)), [month, end])
+    cursor.execute("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)".format(qn(table), qn(name)),
+                   [month, end])
+    return name
+
+
+def default_partition_months(cursor, table):
+    """Months of rows stored in DEFAULT partition of table"""
+    cursor.execute("SELECT DISTINCT date_trunc('month', valid_to) FROM {}".format(
+        connection.ops.quote_name("{}_default".format(table))))
+    return {month_start(row[0]) for row in cursor.fetchall()}
+
+
+def create_archive_partitions(now=None, months_ahead=None):
+    """Create monthly partitions of archive tables up to months_ahead months from now and for months
+    of rows waiting in DEFAULT partitions, returns names of created partitions"""
+    now = now or timezone.now()
+    months_ahead = settings.ARCHIVE_PARTITIONS_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(now)
+    created = []
+    for table in partitioned_tables():
+        with transaction.atomic(), connection.cursor() as cursor:
+            existing = list_partitions(cursor, table)
+            months = {add_months(current, i) for i in range(months_ahead + 1)} | default_partition_months(cursor, table)
+            for month in sorted(months - set(existing)):
+                created.append(create_partition(cursor, table, month))
+    if created:
+        logger.info("Created archive partitions: {}".format(", ".join(created)))
+    return created
+
+
+def detach_archive_partitions(before, drop=False):
+    """Detach monthly partitions of archive tables with all rows older than before.
+    Detached tables stay in database (ready for pg_dump or compression) unless drop is set, returns their names."""
+    qn = connection.ops.quote_name
+    before = month_start(before)
+    detached = []
+    for table in partitioned_tables():
+        with transaction.atomic(), connection.cursor() as cursor:
+            for month, name in sorted(list_partitions(cursor, table).items()):
+                if add_months(month, 1) > before:
+                    continue
+                cursor.execute("ALTER TABLE {} DETACH PARTITION {}".format(qn(table), qn(name)))
+                if drop:
+                    cursor.execute("DROP TABLE {}".format(qn(name)))
+                detached.append(name)
+    if detached:
+        logger.info("{} archive partitions: {}".format("Dropped" if drop else "Detached", ", ".join(detached)))
+    return detached
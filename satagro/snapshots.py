@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import time
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from satagro.api.serializers import DistrictSerializer
+from satagro.models import District, MeteoWarning
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 2
+
+
+def _snapshot_key(district_code):
+    return "satagro:snapshot:{}:{}".format(SNAPSHOT_FORMAT, district_code)
+
+
+def warning_version(warning_data):
+    """Digest of serialized warning"""
+    return hashlib.sha1(json.dumps(warning_data, sort_keys=True).encode()).hexdigest()
+
+
+def district_etag(data):
+    """Strong ETag of serialized district, derived from district code, name and versions of its warnings"""
+    versions = ",".join(warning_version(warning) for warning in data["warnings"])
+    digest = hashlib.sha1("{}|{}|{}".format(data["district_code"], data["name"], versions).encode()).hexdigest()
+    return '"{}"'.format(digest)
+
+
+def build_district_snapshot(district):
+    """Serialize district with prefetched active warnings into document stored in cache"""
+    warnings = list(district.meteowarning_set.all())
+    data = dict(DistrictSerializer(district).data)
+    return {
+        "data": data,
+        "valid_to": [warning.valid_to.timestamp() for warning in warnings],
+        "published": [warning.published.timestamp() if warning.published else None for warning in warnings],
+        "etag": district_etag(data),
+    }
+
+
+def refresh_district_snapshots(district_codes=None):
+    """Materialize snapshots of given districts (all districts when None), returns stored snapshots by district code"""
+    districts = District.objects.defer("geom").prefetch_related(
+        Prefetch("meteowarning_set",
+                 queryset=MeteoWarning.objects.filter(valid_to__gte=timezone.now()).order_by("valid_from", "id"))
+    )
+    if district_codes is not None:
+        if not district_codes:
+            return {}
+        districts = districts.filter(district_code__in=district_codes)
+    snapshots = {district.district_code: build_district_snapshot(district) for district in districts}
+    try:
+        cache.set_many({_snapshot_key(code): snapshot for code, snapshot in snapshots.items()}, timeout=None)
+    except Exception as e:
+        logger.error("Could not store district snapshots: {}".format(e))
+        return {}
+    logger.info("Stored {} district snapshots".format(len(snapshots)))
+    return snapshots
+
+
+def delete_district_snapshots(district_codes):
+    """Drop snapshots of removed districts"""
+    if not district_codes:
+        return
+    try:
+        cache.delete_many([_snapshot_key(code) for code in district_codes])
+    except Exception as e:
+        logger.error("Could not delete district snapshots: {}".format(e))
+
+
+def get_district_snapshot(district_code):
+    """Return stored snapshot of district or None"""
+    try:
+        return cache.get(_snapshot_key(district_code))
+    except Exception as e:
+        logger.error("Could not read district snapshot: {}".format(e))
+        return None
+
+
+def get_district_snapshots(district_codes):
+    """Return stored snapshots of districts by district code, missing snapshots are skipped"""
+    try:
+        stored = cache.get_many([_snapshot_key(code) for code in district_codes])
+    except Exception as e:
+        logger.error("Could not read district snapshots: {}".format(e))
+        return {}
+    return {code: stored[_snapshot_key(code)] for code in district_codes if _snapshot_key(code) in stored}
+
+
+def _has_expired_warnings(snapshot):
+    now = time.time()
+    return any(valid_to < now for valid_to in snapshot["valid_to"])
+
+
+def _active(snapshot, values):
+    now = time.time()
+    return [value for value, valid_to in zip(values, snapshot["valid_to"]) if valid_to >= now]
+
+
+def snapshot_data(snapshot, lon, lat):
+    """Response data from snapshot with request coordinates, warnings expired after snapshot was built are dropped"""
+    data = dict(snapshot["data"])
+    data["lon"] = lon
+    data["lat"] = lat
+    if _has_expired_warnings(snapshot):
+        data["warnings"] = _active(snapshot, data["warnings"])
+    return data
+
+
+def snapshot_validators(snapshot):
+    """Return ETag and Last-Modified timestamp (newest published active warning or None) of snapshot"""
+    if not _has_expired_warnings(snapshot):
+        etag = snapshot["etag"]
+    else:
+        etag = district_etag(dict(snapshot["data"], warnings=_active(snapshot, snapshot["data"]["warnings"])))
+    published = [value for value in _active(snapshot, snapshot["published"]) if value is not None]
+    return etag, max(published) if published else None
@@ -0,0 +1,139 @@
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction, DatabaseError
+from django.db.models import Q
+
+from satagro.helpers import parse_safe_datetime
+from satagro.models import MeteoWarning, District
+
+logger = logging.getLogger(__name__)
+
+WARNING_FIELDS = ['name_of_event', 'grade', 'probability', 'valid_from', 'valid_to', 'published',
+                  'content', 'comment', 'office']
+
+
+@dataclass
+class SyncResult:
+    """Counts of warnings processed by sync_meteo_warnings"""
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    districts: set = field(default_factory=set)
+    published: list = field(default_factory=list)
+    valid_to: dict = field(default_factory=dict)
+
+    @property
+    def changed(self):
+        return bool(self.created or self.updated)
+
+    def as_dict(self):
+        return {"created": self.created, "updated": self.updated,
+                "unchanged": self.unchanged, "failed": self.failed}
+
+
+def check_lengths(values):
+    """Raise ValueError when value is longer than max_length of its MeteoWarning field, one such value
+    would fail the whole bulk write"""
+    for name, value in values.items():
+        max_length = MeteoWarning._meta.get_field(name).max_length
+        if max_length and value is not None and len(str(value)) > max_length:
+            raise ValueError("{} is longer than {} characters".format(name, max_length))
+
+
+def event_to_fields(event):
+    """Map IMGW event to MeteoWarning fields, raises ValueError when event does not fit them"""
+    probability = event.get("prawdopodobienstwo")
+    fields = {
+        "name_of_event": event.get("nazwa_zdarzenia") or "",
+        "grade": event.get("stopien") or "",
+        "probability": "" if probability is None else str(probability),
+        "valid_from": parse_safe_datetime(event.get("obowiazuje_od")),
+        "valid_to": parse_safe_datetime(event.get("obowiazuje_do")),
+        "published": parse_safe_datetime(event.get("opublikowano")),
+        "content": event.get("tresc") or "",
+        "comment": event.get("komentarz") or "",
+        "office": event.get("biuro") or "",
+    }
+    check_lengths(dict(fields, id=event["id"]))
+    if fields["valid_from"] and fields["valid_to"] and fields["valid_from"] > fields["valid_to"]:
+        # tstzrange of validity index can not be built for such row, it would fail the whole bulk write
+        raise ValueError("valid_from is later than valid_to")
+    return fields
+
+
+def sync_meteo_warnings(events):
+    """Synchronize meteo warnings with IMGW events using bulk queries in a single transaction"""
+    result = SyncResult()
+    Through = MeteoWarning.districts.through
+
+    incoming = {}
+    for event in events:
+        try:
+            incoming[event["id"]] = (event_to_fields(event), set(event.get("teryt") or []))
+        except Exception as e:
+            logger.error("Could not parse warning {}: {}".format(event.get("id") if isinstance(event, dict) else event, e))
+            result.failed += 1
+    if not incoming:
+        return result
+
+    existing = MeteoWarning.objects.in_bulk(list(incoming))
+    current_districts = defaultdict(set)
+    for warning_id, district_code in Through.objects.filter(
+            meteowarning_id__in=list(existing)).values_list("meteowarning_id", "district_id"):
+        current_districts[warning_id].add(district_code)
+    known_districts = set(District.objects.values_list("district_code", flat=True))
+
+    to_create, to_update = [], []
+    links_to_add, links_to_remove = [], {}
+    for warning_id, (fields, districts) in incoming.items():
+        districts &= known_districts
+        warning = existing.get(warning_id)
+        if warning is None:
+            to_create.append(MeteoWarning(id=warning_id, **fields))
+            result.published.append(fields["published"])
+            result.valid_to[warning_id] = fields["valid_to"]
+            links_to_add.extend((warning_id, code) for code in districts)
+            result.districts |= districts
+            continue
+        fields_changed = any(getattr(warning, name) != value for name, value in fields.items())
+        current = current_districts[warning_id]
+        if not fields_changed and current == districts:
+            result.unchanged += 1
+            continue
+        if fields_changed:
+            for name, value in fields.items():
+                setattr(warning, name, value)
+            to_update.append(warning)
+            result.valid_to[warning_id] = fields["valid_to"]
+        links_to_add.extend((warning_id, code) for code in districts - current)
+        if current - districts:
+            links_to_remove[warning_id] = current - districts
+        result.updated += 1
+        result.districts |= current | districts
+        result.published.append(fields["published"])
+        logger.info(f"Warning {warning_id} was updated (detected changes in fields)")
+
+    try:
+        with transaction.atomic():
+            MeteoWarning.objects.bulk_create(to_create, batch_size=500)
+            MeteoWarning.objects.bulk_update(to_update, WARNING_FIELDS, batch_size=500)
+            if links_to_remove:
+                condition = Q()
+                for warning_id, codes in links_to_remove.items():
+                    condition |= Q(meteowarning_id=warning_id, district_id__in=codes)
+                Through.objects.filter(condition).delete()
+            Through.objects.bulk_create(
+                [Through(meteowarning_id=warning_id, district_id=code) for warning_id, code in links_to_add],
+                batch_size=1000, ignore_conflicts=True)
+        result.created = len(to_create)
+    except DatabaseError as e:
+        logger.error("Database error synchronizing warnings: {}".format(e))
+        result.failed += len(to_create) + result.updated
+        result.updated = 0
+        result.districts = set()
+        result.published = []
+        result.valid_to = {}
+    return result
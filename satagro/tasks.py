@@ -3,18 +3,28 @@ import os
 
 from celery import shared_task
 from celery.signals import worker_ready
-from django.contrib.gis.gdal import DataSource
-from django.contrib.gis.geos import GEOSGeometry, Polygon, MultiPolygon
-from django.db import transaction, DatabaseError
+from django.conf import settings
+from django.db import DatabaseError
 from django.utils import timezone
-from django.utils.dateparse import parse_datetime
 
-from satagro.helpers import api_request, parse_safe_datetime, warning_has_changed
-from satagro.models import MeteoWarning, District, MeteoWarningArchive
+from satagro.archive import archive_expired_warnings, archive_warnings
+from satagro.archive_timers import due_warnings, remove_due_timers, schedule_archiving
+from satagro.cache import bump_districts_version, bump_warnings_generation, save_feed_state, set_cached_country_envelope
+from satagro.districts import (build_districts, file_sha256, read_district_features, refresh_district_parts,
+                               refresh_voivodeships, swap_districts)
+from satagro.events import publish_district_changes
+from satagro.helpers import fetch_feed
+from satagro.locks import COALESCE, SKIP, singleton_task
+from satagro.metrics import FEED_FETCH_SECONDS, count_rows, observe_ingest_lag, track_task
+from satagro.models import MeteoWarning, District, DistrictDataset
+from satagro.partitions import create_archive_partitions
+from satagro.snapshots import delete_district_snapshots, refresh_district_snapshots
+from satagro.sync import sync_meteo_warnings
 
 logger = logging.getLogger(__name__)
 
 @shared_task
+@track_task("generate_districts")
 def generate_districts():
     """Function to generate districts from a Geoportal districts file (pgr.gml)"""
     logger.info("generating districts")
@@ -24,158 +34,170 @@ def generate_districts():
         logger.error("File pgr.gml does not exist")
         return False
 
-    try:
-        ds = DataSource(file_path)
-        layer = ds[0]
+    source_hash = file_sha256(file_path)
+    if (DistrictDataset.objects.filter(source=file_path, sha256=source_hash).exists()
+            and District.objects.exists()):
+        logger.info("Districts are up to date with {}".format(file_path))
+        return True
+    if DistrictDataset.objects.filter(source=file_path).exists() and District.objects.exists():
+        # new version of already imported file
+        return bool(reload_districts(file_path))
 
+    try:
         existing_codes = set(District.objects.values_list('district_code', flat=True))
-        districts_to_create = []
-
-        for feature in layer:
-            try:
-                if feature["JPT_KOD_JE"].value not in existing_codes:
-                    polygon = GEOSGeometry(feature.geom.wkt)
-                    polygon.srid = layer.srs.srid
-                    polygon.transform(4326)
-
-                    if isinstance(polygon, Polygon):
-                        polygon = MultiPolygon(polygon)
-                    version_from = timezone.make_aware(parse_datetime(feature["WERSJA_OD"].value)) if feature[
-                        "WERSJA_OD"].value else None
-                    version_to = timezone.make_aware(parse_datetime(feature["WERSJA_DO"].value)) if feature[
-                        "WERSJA_DO"].value else None
-                    valid_from = timezone.make_aware(parse_datetime(feature["WAZNY_OD"].value)) if feature[
-                        "WAZNY_OD"].value else None
-                    valid_to = timezone.make_aware(parse_datetime(feature["WAZNY_DO"].value)) if feature[
-                        "WAZNY_DO"].value else None
-
-                    districts_to_create.append(District(
-                        district_code=feature["JPT_KOD_JE"].value,
-                        id=feature["JPT_ID"].value,
-                        name=feature["JPT_NAZWA_"],
-                        type=feature["JPT_SJR_KO"],
-                        version_from=version_from,
-                        version_to=version_to,
-                        valid_from=valid_from,
-                        valid_to=valid_to,
-                        regon=feature["REGON"],
-                        geom=polygon
-                    ))
-            except Exception as e:
-                logger.error("Error processing feature: {}".format(e))
-                continue
+        features, srid = read_district_features(file_path, skip_codes=existing_codes)
+        districts_to_create = build_districts(features, srid)
         if districts_to_create:
             District.objects.bulk_create(districts_to_create, batch_size=1000)
+            count_rows("generate_districts", created=len(districts_to_create))
+            refresh_district_parts([district.district_code for district in districts_to_create])
+            set_cached_country_envelope(refresh_voivodeships())
+            refresh_district_snapshots([district.district_code for district in districts_to_create])
+            bump_districts_version()
+        if len(districts_to_create) == len(features):
+            DistrictDataset.objects.update_or_create(source=file_path, defaults={"sha256": source_hash})
     except Exception as e:
         logger.error("Could not load datasource: {}".format(e))
         return False
     return True
 
 @shared_task
+@singleton_task("reload_districts", policy=SKIP)
+@track_task("reload_districts")
+def reload_districts(file_path="./pgr.gml"):
+    """Function to replace districts with new version of districts file without downtime"""
+    logger.info("reloading districts")
+    if not os.path.exists(file_path):
+        logger.error("File {} does not exist".format(file_path))
+        return None
+    source_hash = file_sha256(file_path)
+    try:
+        features, srid = read_district_features(file_path)
+        districts = build_districts(features, srid)
+        # district missing in partial dataset would be removed together with its warning links
+        if not districts or len(districts) != len(features):
+            logger.error("Districts file {} has invalid features, reload aborted".format(file_path))
+            return None
+        result = swap_districts(districts)
+    except Exception as e:
+        logger.error("Could not reload districts: {}".format(e))
+        return None
+    logger.info("Districts reloaded: {}".format(result.as_dict()))
+    count_rows("reload_districts", **result.as_dict())
+    if result.changed:
+        set_cached_country_envelope(refresh_voivodeships())
+        delete_district_snapshots(result.removed)
+        snapshots = refresh_district_snapshots(result.affected)
+        bump_districts_version()
+        bump_warnings_generation()
+        publish_district_changes(snapshots, "updated")
+    DistrictDataset.objects.update_or_create(source=file_path, defaults={"sha256": source_hash})
+    return result.as_dict()
+
+
+@shared_task
+@singleton_task("move_old_meteo_warnings_to_archive", policy=SKIP)
+@track_task("move_old_meteo_warnings_to_archive")
 def move_old_meteo_warnings_to_archive():
     """Function to archive old meteo warnings"""
     logger.info("move_old_meteo_warnings_to_archive")
 
-    warnings_to_archive = MeteoWarning.objects.filter(valid_to__lt=timezone.now())
-    logger.info(f"Found {warnings_to_archive.count()} warnings to archive")
-
-    for warning in warnings_to_archive:
-        try:
-            with transaction.atomic():
-                archived, created = MeteoWarningArchive.objects.update_or_create(
-                    id=warning.id,
-                    defaults={
-                        'name_of_event': warning.name_of_event,
-                        'grade': warning.grade,
-                        'probability': warning.probability,
-                        'valid_from': warning.valid_from,
-                        'valid_to': warning.valid_to,
-                        'published': warning.published,
-                        'content': warning.content,
-                        'comment': warning.comment,
-                        'office': warning.office,
-                    }
-                )
-                archived.districts.clear()
-                archived.districts.add(*warning.districts.all())
-                warning.delete()
-
-        except Exception as e:
-            logger.error(f"Could not archive warning {warning.id}: {e}")
-
+    archived_count, districts = archive_expired_warnings()
+    logger.info(f"Archived {archived_count} warnings")
+    count_rows("move_old_meteo_warnings_to_archive", archived=archived_count)
+    if archived_count:
+        refresh_archived_districts(districts)
     logger.info("Archiving process completed")
 
 
+@shared_task
+@singleton_task("archive_due_meteo_warnings", policy=SKIP)
+@track_task("archive_due_meteo_warnings")
+def archive_due_meteo_warnings():
+    """Function called every few seconds to archive warnings which archive timers (valid_to) are due"""
+    now = timezone.now()
+    archived_count, districts = 0, set()
+    while True:
+        warning_ids = due_warnings(now)
+        if not warning_ids:
+            break
+        moved, chunk_districts = archive_warnings(warning_ids, now)
+        archived_count += len(moved)
+        districts |= chunk_districts
+        if not remove_due_timers(moved, now) or not release_stale_timers(set(warning_ids) - set(moved), now):
+            break
+        # remaining timers belong to warnings locked by another transaction or to failed chunk, next run retries them
+        if not moved or len(warning_ids) < settings.ARCHIVE_CHUNK_SIZE:
+            break
+    count_rows("archive_due_meteo_warnings", archived=archived_count)
+    if archived_count:
+        logger.info(f"Archived {archived_count} warnings at their valid_to")
+        refresh_archived_districts(districts)
+    return archived_count
+
+
+def release_stale_timers(warning_ids, now):
+    """Drop timers of warnings which are already archived or have no valid_to and move timers of warnings
+    which valid_to was extended, returns False when timers could not be changed"""
+    if not warning_ids:
+        return True
+    try:
+        valid_to = dict(MeteoWarning.objects.filter(id__in=warning_ids).values_list("id", "valid_to"))
+    except DatabaseError as e:
+        logger.error("Could not check warnings of stale archive timers: {}".format(e))
+        return False
+    stale = [warning_id for warning_id in warning_ids if valid_to.get(warning_id) is None]
+    schedule_archiving({warning_id: moment for warning_id, moment in valid_to.items()
+                        if moment is not None and moment >= now})
+    return remove_due_timers(stale, now)
+
+
+def refresh_archived_districts(districts):
+    """Refresh snapshots of districts which warnings were archived and notify subscribers and caches"""
+    snapshots = refresh_district_snapshots(districts)
+    publish_district_changes(snapshots, "archived")
+    bump_warnings_generation()
+
+
+@shared_task
+def create_meteo_warning_archive_partitions():
+    """Function to create monthly partitions of archive before warnings expire into them"""
+    try:
+        return create_archive_partitions()
+    except DatabaseError as e:
+        logger.error("Could not create archive partitions: {}".format(e))
+        return None
+
+
 @worker_ready.connect
 def run_at_start(sender, **kwargs):
-    """Generate district before celery tasks starts"""
+    """Generate district and district snapshots before celery tasks starts"""
     generate_districts()
+    refresh_district_snapshots()
+    create_meteo_warning_archive_partitions()
+    schedule_archiving(dict(MeteoWarning.objects.values_list("id", "valid_to")))
 
 
 @shared_task
+@singleton_task("get_meteo_warnings", policy=COALESCE)
+@track_task("get_meteo_warnings")
 def get_meteo_warnings():
     """Function that is called every minute to download current meteorological warnings"""
     logger.info("get_meteo_warnings_")
-    events = api_request('https://danepubliczne.imgw.pl/api/data/warningsmeteo')
-    for event in events:
-        try:
-            existing_warning = MeteoWarning.objects.get(id=event.get("id"))
-            if warning_has_changed(existing_warning, event):
-                logger.info(f"Warning {event.get('id')} was updated (detected changes in fields)")
-                update_warning(existing_warning, event)
-        except MeteoWarning.DoesNotExist:
-            create_warning(event)
-
-
-def create_warning(event):
-    """Create Warning if not exists in db"""
-    valid_from = parse_safe_datetime(event.get("obowiazuje_od"))
-    valid_to = parse_safe_datetime(event.get("obowiazuje_do"))
-    published = parse_safe_datetime(event.get("opublikowano"))
-    try:
-        with transaction.atomic():
-            meteo = MeteoWarning.objects.create(
-                id=event["id"],
-                name_of_event=event.get("nazwa_zdarzenia"),
-                grade=event.get("stopien"),
-                probability=event.get("prawdopodobienstwo"),
-                valid_from=valid_from,
-                valid_to=valid_to,
-                published=published,
-                content=event.get("tresc"),
-                comment=event.get("komentarz"),
-                office=event.get("biuro")
-            )
-            districts = District.objects.filter(district_code__in=event.get("teryt"))
-            meteo.districts.add(*districts)
-    except DatabaseError as e:
-        logger.error("Database error saving warning {}: {}".format(event.get('id'), e))
-    except Exception as e:
-        logger.error("Unexpected error saving warning {}: {}".format(event.get('id'), e))
-
-
-def update_warning(existing_warning, event):
-    """Update warning if published date changed"""
-    try:
-        with transaction.atomic():
-            valid_from = parse_safe_datetime(event.get("obowiazuje_od"))
-            valid_to = parse_safe_datetime(event.get("obowiazuje_do"))
-            published = parse_safe_datetime(event.get("opublikowano"))
-
-            existing_warning.name_of_event = event.get("nazwa_zdarzenia", "")
-            existing_warning.grade = event.get("stopien")
-            existing_warning.probability = event.get("prawdopodobienstwo")
-            existing_warning.valid_from = valid_from
-            existing_warning.valid_to = valid_to
-            existing_warning.published = published
-            existing_warning.content = event.get("tresc")
-            existing_warning.comment = event.get("komentarz")
-            existing_warning.office = event.get("biuro")
-            existing_warning.save()
-            districts = District.objects.filter(district_code__in=event.get("teryt",[]))
-            existing_warning.districts.set(districts)
-            logger.info(f"Successfully updated warning {existing_warning.id}")
-    except DatabaseError as e:
-        logger.error(f"Database error updating warning {existing_warning.id}: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error updating warning {existing_warning.id}: {e}")
+    url = settings.IMGW_WARNINGS_URL
+    with FEED_FETCH_SECONDS.time():
+        events, feed_state = fetch_feed(url)
+    if events is None:
+        return None
+    result = sync_meteo_warnings(events)
+    logger.info("Meteo warnings synchronized: {}".format(result.as_dict()))
+    count_rows("get_meteo_warnings", **result.as_dict())
+    observe_ingest_lag(result.published, timezone.now())
+    schedule_archiving(result.valid_to)
+    if result.changed:
+        snapshots = refresh_district_snapshots(result.districts)
+        publish_district_changes(snapshots, "updated")
+        bump_warnings_generation()
+    if not result.failed:
+        save_feed_state(url, feed_state)
+    return result.as_dict()
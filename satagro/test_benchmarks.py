@@ -0,0 +1,107 @@
+import os
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from satagro.api.views import create_point, get_district_with_warnings
+from satagro.benchmark import coordinate_grid, git_commit, measure_batch, measure_calls, save_results, synthetic_events
+from satagro.models import District, MeteoWarning, MeteoWarningArchive
+from satagro.sync import sync_meteo_warnings
+from satagro.tasks import generate_districts, get_meteo_warnings, move_old_meteo_warnings_to_archive
+
+# Benchmarks run against local PostGIS only on demand: BENCHMARK=1 pytest satagro/test_benchmarks.py -s
+# Results are written to BENCHMARK_OUTPUT (default benchmark-<commit>.json) to compare them between commits.
+pytestmark = pytest.mark.skipif(not os.environ.get("BENCHMARK"), reason="set BENCHMARK=1 to run benchmarks")
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache():
+    """Benchmarks measure configured Redis cache, not in-memory cache of other tests"""
+    yield
+
+
+@pytest.fixture(scope="module")
+def benchmark_results():
+    results = {}
+    yield results
+    path = os.environ.get("BENCHMARK_OUTPUT") or "benchmark-{}.json".format(git_commit() or "local")
+    save_results(results, path)
+
+
+@pytest.fixture(scope="module")
+def district_codes(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        generate_districts()
+        return sorted(District.objects.values_list("district_code", flat=True))
+
+
+@pytest.fixture
+def active_warnings(db, district_codes):
+    sync_meteo_warnings(synthetic_events(100, district_codes))
+
+
+def lookup(lon, lat):
+    point, _ = create_point(lon, lat)
+    get_district_with_warnings(point)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("index_enabled", [False, True])
+def test_benchmark_district_lookup(benchmark_results, active_warnings, settings, index_enabled):
+    settings.DISTRICT_INDEX_ENABLED = index_enabled
+    grid = coordinate_grid()
+    result = measure_calls(lookup, grid)
+    benchmark_results["get_district_with_warnings[index={}]".format(index_enabled)] = result
+    assert result["calls"] == len(grid)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("cached", [False, True])
+@pytest.mark.parametrize("fast_json", [False, True])
+def test_benchmark_meteo_warnings_view(benchmark_results, active_warnings, settings, cached, fast_json):
+    settings.METEO_WARNINGS_CACHE_ENABLED = cached
+    settings.DISTRICT_SNAPSHOTS_ENABLED = cached
+    settings.FAST_JSON_VIEWS = ["meteo_warnings"] if fast_json else []
+    client = APIClient()
+    url = reverse("meteo_warnings")
+    grid = coordinate_grid(step=0.5)
+
+    def request(lon, lat):
+        assert client.get(url, {"lon": lon, "lat": lat}).status_code in (200, 404)
+
+    result = measure_calls(request, grid)
+    benchmark_results["meteo_warnings_view[cached={},fast_json={}]".format(cached, fast_json)] = result
+    assert result["calls"] == len(grid)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("count", [10, 100, 1000])
+def test_benchmark_get_meteo_warnings(benchmark_results, district_codes, monkeypatch, count):
+    events = synthetic_events(count, district_codes)
+    monkeypatch.setattr("satagro.tasks.fetch_feed", lambda url: (events, {"sha256": str(count)}))
+    created, result = measure_batch(get_meteo_warnings, count)
+    assert result["created"] == count
+    unchanged, _ = measure_batch(get_meteo_warnings, count)
+
+    events = synthetic_events(count, district_codes, published=timezone.now())
+    updated, result = measure_batch(get_meteo_warnings, count)
+    assert result["updated"] == count
+    benchmark_results["get_meteo_warnings[{}]".format(count)] = {
+        "created": created, "unchanged": unchanged, "updated": updated}
+
+
+@pytest.mark.django_db
+def test_benchmark_move_old_meteo_warnings_to_archive(benchmark_results, district_codes):
+    count = 10000
+    events = synthetic_events(count, district_codes)
+    expired = timezone.now() - timedelta(days=1)
+    sync_meteo_warnings(events)
+    MeteoWarning.objects.update(valid_from=expired - timedelta(hours=12), valid_to=expired)
+
+    result, _ = measure_batch(move_old_meteo_warnings_to_archive, count)
+    benchmark_results["move_old_meteo_warnings_to_archive[{}]".format(count)] = result
+    assert MeteoWarningArchive.objects.count() == count
+    assert not MeteoWarning.objects.exists()
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from satagro.cache import (OUT_OF_BOUNDS, bump_warnings_generation, get_cached_district_code,
+                           get_cached_district_data, get_warnings_generation, set_cached_district_code,
+                           set_cached_district_data)
+
+
+def test_point_cache_returns_district_for_nearby_coordinates():
+    set_cached_district_code(17.008185553339786, 52.56698693108296, "3021")
+    assert get_cached_district_code(17.008185553, 52.566986931) == "3021"
+
+
+def test_point_cache_remembers_points_out_of_bounds():
+    set_cached_district_code(0, 0, None)
+    assert get_cached_district_code(0, 0) == OUT_OF_BOUNDS
+
+
+def test_point_cache_keeps_points_out_of_bounds_shorter(settings, monkeypatch):
+    timeouts = {}
+    monkeypatch.setattr("satagro.cache.cache.set",
+                        lambda key, value, timeout: timeouts.__setitem__(value, timeout))
+    set_cached_district_code(17.0, 52.5, "3021")
+    set_cached_district_code(0, 0, None)
+    assert timeouts == {"3021": settings.POINT_CACHE_TIMEOUT, OUT_OF_BOUNDS: settings.POINT_CACHE_MISS_TIMEOUT}
+
+
+def test_district_cache_is_invalidated_by_new_generation():
+    generation = get_warnings_generation()
+    set_cached_district_data("3021", generation, {"district_code": "3021"})
+    assert get_cached_district_data("3021", generation) == {"district_code": "3021"}
+    assert get_cached_district_data("3021", bump_warnings_generation()) is None
+
+
+def test_district_cache_is_not_stored_when_warning_already_expired():
+    generation = get_warnings_generation()
+    set_cached_district_data("3021", generation, {"district_code": "3021"},
+                             expires_at=timezone.now() - timedelta(minutes=1))
+    assert get_cached_district_data("3021", generation) is None
+
+
+def test_district_cache_entry_without_expiry_has_bounded_timeout(settings, monkeypatch):
+    timeouts = []
+    monkeypatch.setattr("satagro.cache.cache.set", lambda key, value, timeout: timeouts.append(timeout))
+    set_cached_district_data("3021", get_warnings_generation(), {"district_code": "3021"})
+    set_cached_district_data("3021", get_warnings_generation(), {"district_code": "3021"},
+                             expires_at=timezone.now() + timedelta(days=2))
+    assert timeouts == [settings.METEO_WARNINGS_CACHE_TIMEOUT, settings.METEO_WARNINGS_CACHE_TIMEOUT]
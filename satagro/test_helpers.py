@@ -1,12 +1,30 @@
+import io
 import logging
+import os
+import subprocess
+import sys
+from datetime import timedelta
 from types import SimpleNamespace
 
-from django.contrib.gis.geos import Point
+import pytest
+from django.contrib.gis.geos import MultiPolygon, Point, Polygon
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
 
-from satagro.api.views import create_point, check_lat_and_lon
-from satagro.helpers import parse_safe_datetime, api_request
+from satagro.api.rendering import render_json
+from satagro.api.views import create_point, check_lat_and_lon, parse_batch_points, etag_matches, parse_time_range
+from satagro.benchmark import coordinate_grid, percentile
+from satagro.cache import save_feed_state
+from satagro.district_index import DistrictIndex, in_country_envelope
+from satagro.events import format_event
+from satagro.geocoding import parse_observation_time, read_csv_chunks, resolve_coordinates, time_ranges
+from satagro.helpers import parse_safe_datetime, api_request, fetch_feed
+from satagro.metrics import ServicesCollector, observe_ingest_lag, observe_stage, render_metrics
+from satagro.partitions import add_months, month_start, partition_name
+from satagro.snapshots import district_etag, snapshot_validators
+from satagro.tiles import tile_extent, tile_is_valid
 
 logger = logging.getLogger(__name__)
 def test_parse_safe_datetime_should_report_none_if_none_given():
@@ -37,6 +55,13 @@ def test_api_request_return_none_when_correct_date_without_https_given():
     req = api_request("https://danepubliczne.imgw.pl/api/data/warningsmeteoa")
     assert req is None
 
+def test_fetch_feed_returns_none_when_feed_did_not_change():
+    url = "https://danepubliczne.imgw.pl/api/data/warningsmeteo"
+    payload, state = fetch_feed(url)
+    assert payload is not None
+    save_feed_state(url, state)
+    assert fetch_feed(url) == (None, None)
+
 """Test views functions create_point, check_lat_and_lon get_district_with_warnings"""
 
 def test_create_point_if_both_values_are_correct():
@@ -61,3 +86,157 @@ def test_create_check_lat_and_lon_if_return_correct_values():
     res = check_lat_and_lon(request)
     assert res == {'lat':43.2432243234, 'lon': 21.2432243234}
 
+@pytest.mark.parametrize("value", ["nan", "inf", "-Infinity"])
+def test_check_lat_and_lon_rejects_non_finite_coordinates(value):
+    res = check_lat_and_lon(SimpleNamespace(query_params={"lon": value, "lat": "52.2"}))
+    assert res.status_code == 400
+    points, _ = parse_batch_points([{"lon": "21.1", "lat": value}])
+    assert type(points[0]) == str
+
+def test_parse_batch_points_returns_error_for_each_incorrect_point():
+    points, error = parse_batch_points({"points": [{"lon": "21.1", "lat": "52.2"}, {"lon": "21.1"}]})
+    assert error is None
+    assert points[0] == (21.1, 52.2)
+    assert type(points[1]) == str
+
+def test_parse_batch_points_returns_error_when_points_are_missing():
+    points, error = parse_batch_points({"lon": 21.1, "lat": 52.2})
+    assert points is None
+    assert error is not None
+
+def test_etag_matches_if_none_match_header():
+    request = SimpleNamespace(META={"HTTP_IF_NONE_MATCH": '"abc", "def"'})
+    assert etag_matches(request, '"def"')
+    assert not etag_matches(request, '"xyz"')
+
+def test_snapshot_validators_change_when_warning_expires():
+    data = {"district_code": "3021", "name": "powiat poznański", "lon": None, "lat": None,
+            "warnings": [{"id": "expired"}, {"id": "active"}]}
+    snapshot = {"data": data, "valid_to": [0, 32503680000], "published": [10, 20], "etag": district_etag(data)}
+    etag, last_modified = snapshot_validators(snapshot)
+    assert etag != snapshot["etag"]
+    assert etag == district_etag(dict(data, warnings=[{"id": "active"}]))
+    assert last_modified == 20
+
+def test_format_event_splices_coordinates_of_subscribed_point():
+    message = '{"event": "updated", "data": {"district_code": "3021", "lon": null, "lat": null, "warnings": []}}'
+    event = format_event(message, 17.0, 52.5)
+    assert event.startswith("event: updated\ndata: ")
+    assert event.endswith("\n\n")
+    assert '"lon": 17.0' in event
+
+def test_tile_is_valid_rejects_tiles_out_of_pyramid():
+    assert tile_is_valid(6, 35, 21)
+    assert not tile_is_valid(2, 4, 0)
+    assert not tile_is_valid(-1, 0, 0)
+
+def test_tile_extent_of_poznan_area_tile():
+    xmin, ymin, xmax, ymax = tile_extent(6, 35, 21)
+    assert (xmin, xmax) == (16.875, 22.5)
+    assert ymin == pytest.approx(48.9225, abs=1e-4) and ymax == pytest.approx(52.4828, abs=1e-4)
+    assert tile_extent(0, 0, 0)[0] == -180 and tile_extent(0, 0, 0)[2] == 180
+
+def test_archive_partition_months_are_aligned_to_utc_month():
+    month = month_start(parse_datetime("2025-12-31T23:30:00-02:00"))
+    assert month.isoformat() == "2026-01-01T00:00:00+00:00"
+    assert add_months(month, -1).isoformat() == "2025-12-01T00:00:00+00:00"
+    assert add_months(month, 13).isoformat() == "2027-02-01T00:00:00+00:00"
+    assert partition_name("satagro_meteowarningarchive", month) == "satagro_meteowarningarchive_p202601"
+
+def test_benchmark_percentile_interpolates_between_ranks():
+    assert percentile([4, 1, 3, 2], 50) == 2.5
+    assert percentile([1, 2, 3, 4, 5], 90) == 4.6
+    assert percentile([], 50) is None
+    assert coordinate_grid(step=1.0) == coordinate_grid(step=1.0)
+
+def test_metrics_are_rendered_in_prometheus_format():
+    with observe_stage("test_view", "spatial_query"):
+        pass
+    now = timezone.now()
+    observe_ingest_lag([now - timedelta(minutes=2), None], now)
+    content, content_type = render_metrics()
+    assert content_type.startswith("text/plain")
+    assert b'satagro_api_stage_seconds_count{stage="spatial_query",view="test_view"} 1.0' in content
+    assert b"satagro_ingest_lag_seconds_bucket" in content
+
+def test_services_collector_merges_samples_of_all_services(tmp_path):
+    for service in ("django", "celery"):
+        (tmp_path / service).mkdir()
+        subprocess.run([sys.executable, "-c", "from prometheus_client import Counter; Counter('satagro_test', 'Test').inc()"],
+                       env=dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path / service)), check=True)
+    samples = {sample.name: sample.value for metric in ServicesCollector(str(tmp_path)).collect()
+               for sample in metric.samples}
+    assert samples["satagro_test_total"] == 2.0
+
+def test_render_json_matches_drf_renderer_bytes():
+    data = {"district_code": "3021", "name": "powiat poznański", "lon": 16.43304832145737, "lat": 52.0,
+            "warnings": [{"id": "1", "content": "Burze\u2028\u2029 \"cytat\" <b>\n", "comment": None, "grade": "2"}]}
+    assert render_json(data) == JSONRenderer().render(data)
+
+def test_district_index_looks_up_voivodeship_first():
+    def square(x, y, size=1):
+        return MultiPolygon(Polygon.from_bbox((x, y, x + size, y + size)), srid=4326)
+    districts = [("0201", square(0, 0)), ("0202", square(1, 0)), ("0401", square(5, 5))]
+    index = DistrictIndex(districts, [("02", square(0, 0, 2)), ("04", square(5, 5))])
+    assert index.envelope == (0, 0, 6, 6)
+    assert index.lookup(Point(1.5, 0.5)) == "0202"
+    assert index.lookup(Point(5.5, 5.5)) == "0401"
+    assert index.lookup(Point(3, 3)) is None
+    assert index.lookup(Point(-1, 0.5)) is None
+    assert DistrictIndex(districts).lookup(Point(0.5, 0.5)) == "0201"
+
+def test_geocoding_reads_csv_in_chunks_and_resolves_coordinates():
+    columns, chunks = read_csv_chunks(io.StringIO("id,lon,lat\n1,0.5,0.5\n2,x,0.5\n3,9,9\n"), chunk_size=2)
+    chunks = list(chunks)
+    assert columns == ["id", "lon", "lat"]
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    index = DistrictIndex([("0201", MultiPolygon(Polygon.from_bbox((0, 0, 1, 1)), srid=4326))])
+    assert resolve_coordinates(index, [(0.5, 0.5), (None, 0.5), (9.0, 9.0)]) == ["0201", None, None]
+    assert parse_observation_time("2025-09-16T03:00:00+00:00").isoformat() == "2025-09-16T03:00:00+00:00"
+    assert parse_observation_time("2025-09-16 05:00").utcoffset() == timedelta(hours=2)
+    assert parse_observation_time("yesterday") is None
+
+def test_geocoding_time_ranges_leave_out_widest_gaps():
+    day = timedelta(days=1)
+    start = timezone.now()
+    moments = [start + 400 * day, start, start + day, start + 2 * day, start + 30 * day, start + day]
+    assert time_ranges(moments, max_ranges=2) == [(start, start + 30 * day), (start + 400 * day, start + 400 * day)]
+    assert len(time_ranges(moments)) == 5
+    assert time_ranges([start], max_ranges=1) == [(start, start)]
+
+def test_parse_time_range_accepts_at_or_from_and_to():
+    (start, end), error = parse_time_range({"at": "2025-09-16 03:00:00"})
+    assert start == end == parse_safe_datetime("2025-09-16 03:00:00") and error is None
+    (start, end), _ = parse_time_range({"from": "2025-09-16T01:00:00+00:00", "to": "2025-09-17 03:00:00"})
+    assert start.isoformat() == "2025-09-16T01:00:00+00:00" and end > start
+    assert parse_time_range({}) == (None, None)
+    assert parse_time_range({"from": "2025-09-16 03:00:00"})[1] is not None
+    assert parse_time_range({"from": "2025-09-17 03:00:00", "to": "2025-09-16 03:00:00"})[1] is not None
+
+
+def test_in_country_envelope_does_not_reject_points_when_envelope_fails(monkeypatch):
+    def broken():
+        raise RuntimeError("no database")
+
+    monkeypatch.setattr("satagro.district_index._envelope_holder.get", broken)
+    assert in_country_envelope(Point(0, 0, srid=4326))
+
+
+def test_meteo_warnings_stream_is_refused_under_wsgi(client):
+    response = client.get("/api/meteo_warnings/stream/", {"districts": "3021"})
+    assert response.status_code == 501
+
+
+@pytest.mark.parametrize("params", [{"lon": "nan", "lat": "52.2"}, {"lon": "16.9", "lat": "inf"},
+                                    {"lon": "abc", "lat": "52.2"}, {"lon": "16.9"}, {}])
+def test_meteo_warnings_api_rejects_invalid_coordinates(params):
+    response = APIClient().get("/api/meteo_warnings/", params)
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+@pytest.mark.parametrize("limit", ["0", "-1"])
+def test_archive_api_rejects_limit_below_one(client, limit):
+    response = client.get("/api/meteo_warnings/archive/", {"district": "3021", "limit": limit})
+    assert response.status_code == 400
+    assert response.json() == {"error": "limit must be at least 1"}
+
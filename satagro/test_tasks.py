@@ -1,12 +1,32 @@
-from datetime import timedelta
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from django.test import AsyncClient
+from rest_framework.test import APIClient
 
 from satagro.api.views import create_point, get_district_with_warnings
+from satagro.archive import archive_expired_warnings
+from satagro.archive_timers import TIMERS_KEY, get_client, schedule_archiving
 from satagro.conftest import create_event_with_params
-from satagro.helpers import warning_has_changed
-from satagro.models import MeteoWarning, MeteoWarningArchive, District
-from satagro.tasks import move_old_meteo_warnings_to_archive, generate_districts, create_warning, update_warning
+from satagro.districts import swap_districts
+from satagro.district_index import get_district_index, in_country_envelope, reset_district_index
+from satagro.events import CHANNEL_PREFIX, broadcaster
+from satagro.export import aexport_chunks, export_chunks
+from satagro.geocoding import geocode_chunks
+from satagro.locks import COALESCE, SKIP, singleton_task
+from satagro.models import MeteoWarning, MeteoWarningArchive, District, DistrictDataset, DistrictPart, Voivodeship
+from satagro.partitions import create_archive_partitions, detach_archive_partitions
+from satagro.snapshots import get_district_snapshot, refresh_district_snapshots, snapshot_data
+from satagro.sync import sync_meteo_warnings
+from satagro.tiles import render_tile, tile_district_codes
+from satagro.tasks import archive_due_meteo_warnings, move_old_meteo_warnings_to_archive, generate_districts
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -19,19 +39,67 @@ def test_how_many_districts_in_db(setup_districts):
     districts = District.objects.all()
     assert len(districts) == 380
 
+@pytest.mark.django_db
+def test_generate_districts_skips_already_imported_file(setup_districts):
+    assert DistrictDataset.objects.filter(source="./pgr.gml").exists()
+    assert generate_districts() is True
+    assert District.objects.count() == 380
+
+@pytest.mark.django_db
+def test_generate_districts_creates_subdivided_parts(setup_districts, settings):
+    assert DistrictPart.objects.values('district').distinct().count() == 380
+    assert all(part.geom.num_points <= settings.DISTRICT_SUBDIVIDE_MAX_VERTICES
+               for part in DistrictPart.objects.filter(district_id="3021"))
+
 @pytest.mark.django_db
 def test_if_point_is_in_poznanski_district(setup_districts):
-    point = create_point(17.008185553339786,52.56698693108296)
+    point, _ = create_point(17.008185553339786,52.56698693108296)
     res = get_district_with_warnings(point)
     assert type(res[0]) == District
     assert res[0].name == "powiat poznański"
 
 @pytest.mark.django_db
 def test_if_point_is_good_but_out_of_polish_country_bounds(setup_districts):
-    point = create_point(0,0)
+    point, _ = create_point(0,0)
     res = get_district_with_warnings(point)
     assert res[0] is None
 
+@pytest.mark.django_db
+def test_district_index_finds_poznanski_district(setup_districts):
+    reset_district_index()
+    point, _ = create_point(17.008185553339786, 52.56698693108296)
+    district_code = get_district_index().lookup(point)
+    assert District.objects.get(district_code=district_code).name == "powiat poznański"
+
+@pytest.mark.django_db
+def test_district_index_returns_none_out_of_polish_country_bounds(setup_districts):
+    reset_district_index()
+    point, _ = create_point(0, 0)
+    assert get_district_index().lookup(point) is None
+
+@pytest.mark.django_db
+def test_get_district_with_warnings_uses_district_index(setup_districts, settings):
+    settings.DISTRICT_INDEX_ENABLED = True
+    reset_district_index()
+    point, _ = create_point(17.008185553339786, 52.56698693108296)
+    res = get_district_with_warnings(point)
+    assert type(res[0]) == District
+    assert res[0].name == "powiat poznański"
+
+@pytest.mark.django_db
+def test_batch_lookup_returns_result_for_every_point(setup_districts):
+    response = APIClient().post(reverse("meteo_warnings_batch"), {"points": [
+        {"lon": 17.008185553339786, "lat": 52.56698693108296},
+        {"lon": 0, "lat": 0},
+        {"lon": "abc", "lat": 52.1},
+    ]}, format="json")
+    results = response.json()["results"]
+    assert response.status_code == 200
+    assert results[0]["name"] == "powiat poznański"
+    assert results[0]["lon"] == 17.008185553339786
+    assert results[1]["error"] == "Localization is out of Polish Country boundaries"
+    assert "error" in results[2]
+
 
 """Meteo Warning Archive"""
 def test_archiving_normal(warning_factory):
@@ -52,34 +120,337 @@ def test_archiving_minute_after(warning_factory):
         MeteoWarning.objects.get(id=warning.id)
 
 @pytest.mark.django_db
-def test_create_warning_if_creates_correctly():
+def test_archiving_in_chunks_moves_districts(setup_districts, warning_factory, settings):
+    settings.ARCHIVE_CHUNK_SIZE = 1
+    first = warning_factory(id="first", valid_to_delta=timedelta(days=1))
+    first.districts.add("3021")
+    warning_factory(id="second", valid_to_delta=timedelta(days=2))
+    move_old_meteo_warnings_to_archive()
+    assert MeteoWarning.objects.count() == 0
+    assert MeteoWarningArchive.objects.count() == 2
+    assert list(MeteoWarningArchive.objects.get(id=first.id).districts.values_list('district_code', flat=True)) == ["3021"]
+
+@pytest.mark.django_db
+def test_sync_meteo_warnings_creates_warning_correctly():
     event = create_event_with_params(
         valid_to_delta=timedelta(minutes=1),
         nazwa_zdarzenia="Custom Event"
     )
-    create_warning(event)
+    sync_meteo_warnings([event])
     assert len(MeteoWarning.objects.all()) == 1
 
 @pytest.mark.django_db
-def test_update_warning_if_updates_correctly():
+def test_sync_meteo_warnings_updates_warning_correctly():
     event = create_event_with_params(
         valid_to_delta=timedelta(minutes=1),
         nazwa_zdarzenia="Custom Event"
     )
-    create_warning(event)
+    sync_meteo_warnings([event])
     assert MeteoWarning.objects.filter(id=event['id']).first().name_of_event == "Custom Event"
-    meteo_warning = MeteoWarning.objects.get(id=event['id'])
     event['nazwa_zdarzenia'] = "Custom"
-    update_warning(meteo_warning, event)
+    sync_meteo_warnings([event])
     assert len(MeteoWarning.objects.all()) == 1
     assert MeteoWarning.objects.filter(id=event['id']).first().name_of_event == "Custom"
 
 @pytest.mark.django_db
-def test_warning_has_changed_returns_true_when_data_incorrect():
-    event = create_event_with_params(
-        valid_to_delta=timedelta(minutes=1),
-        nazwa_zdarzenia="Custom Event"
-    )
-    create_warning(event)
+def test_sync_meteo_warnings_creates_and_skips_unchanged_warnings(setup_districts):
+    event = create_event_with_params(valid_to_delta=-timedelta(days=1))
+    assert sync_meteo_warnings([event]).as_dict() == {"created": 1, "updated": 0, "unchanged": 0, "failed": 0}
+    assert MeteoWarning.objects.get(id=event['id']).districts.count() == 10
+    assert sync_meteo_warnings([event]).as_dict() == {"created": 0, "updated": 0, "unchanged": 1, "failed": 0}
+
+@pytest.mark.django_db
+def test_sync_meteo_warnings_skips_only_event_not_fitting_columns(setup_districts):
+    valid = create_event_with_params(id="valid")
+    too_long = create_event_with_params(id="too_long", stopien="1234")
+    assert sync_meteo_warnings([valid, too_long]).as_dict() == {"created": 1, "updated": 0, "unchanged": 0, "failed": 1}
+    assert list(MeteoWarning.objects.values_list("id", flat=True)) == ["valid"]
+
+@pytest.mark.django_db
+def test_sync_meteo_warnings_skips_only_event_valid_from_after_valid_to(setup_districts):
+    valid = create_event_with_params(id="valid")
+    reversed_range = create_event_with_params(id="reversed", valid_from_delta=-timedelta(days=2),
+                                              valid_to_delta=-timedelta(days=1))
+    assert sync_meteo_warnings([valid, reversed_range]).as_dict() == {"created": 1, "updated": 0, "unchanged": 0,
+                                                                      "failed": 1}
+    assert list(MeteoWarning.objects.values_list("id", flat=True)) == ["valid"]
+
+@pytest.mark.django_db
+def test_sync_meteo_warnings_updates_fields_and_districts(setup_districts):
+    event = create_event_with_params(valid_to_delta=-timedelta(days=1))
+    sync_meteo_warnings([event])
     event['nazwa_zdarzenia'] = "Changed Event"
-    assert warning_has_changed(MeteoWarning.objects.get(id=event['id']), event) == True
+    event['teryt'] = ["3205", "3021"]
+    result = sync_meteo_warnings([event])
+    warning = MeteoWarning.objects.get(id=event['id'])
+    assert result.updated == 1
+    assert warning.name_of_event == "Changed Event"
+    assert set(warning.districts.values_list('district_code', flat=True)) == {"3205", "3021"}
+
+@pytest.mark.django_db
+def test_district_snapshot_contains_active_warnings(setup_districts):
+    event = create_event_with_params(valid_to_delta=-timedelta(days=1), teryt=["3021"])
+    result = sync_meteo_warnings([event])
+    refresh_district_snapshots(result.districts)
+    data = snapshot_data(get_district_snapshot("3021"), 17.0, 52.5)
+    assert data["name"] == "powiat poznański"
+    assert (data["lon"], data["lat"]) == (17.0, 52.5)
+    assert [warning["id"] for warning in data["warnings"]] == [event["id"]]
+
+def test_snapshot_data_drops_warnings_expired_after_snapshot_was_built():
+    snapshot = {"data": {"district_code": "3021", "name": "powiat poznański", "lon": None, "lat": None,
+                         "warnings": [{"id": "expired"}, {"id": "active"}]},
+                "valid_to": [0, 32503680000]}
+    assert snapshot_data(snapshot, 17.0, 52.5)["warnings"] == [{"id": "active"}]
+
+@pytest.mark.django_db
+def test_render_tile_of_poznan_area(setup_districts):
+    assert "3021" in tile_district_codes(6, 35, 21, districts_version=0)
+    assert tile_district_codes(6, 0, 0, districts_version=0) == []
+    assert cache.get("satagro:tile_districts:0:6:0:0") is None
+    assert len(render_tile(6, 35, 21)) > 0
+    assert render_tile(6, 0, 0) == b""
+
+@pytest.mark.django_db
+def test_export_streams_feature_for_every_warning_district(setup_districts):
+    event = create_event_with_params(valid_to_delta=-timedelta(days=1), teryt=["3021", "3064"])
+    sync_meteo_warnings([event])
+    lines = list(export_chunks("ndjson", simplify=0.01))
+    features = [json.loads(line) for line in lines]
+    assert [feature["properties"]["district_code"] for feature in features] == ["3021", "3064"]
+    assert features[0]["geometry"]["type"] in ("Polygon", "MultiPolygon")
+    assert json.loads("".join(export_chunks("geojson")))["type"] == "FeatureCollection"
+
+@pytest.mark.django_db
+def test_async_export_matches_sync_export(setup_districts):
+    sync_meteo_warnings([create_event_with_params(valid_to_delta=-timedelta(days=1), teryt=["3021", "3064"])])
+
+    async def read_export(export_format):
+        return [chunk async for chunk in aexport_chunks(export_format, simplify=0.01)]
+
+    for export_format in ("ndjson", "geojson"):
+        assert async_to_sync(read_export)(export_format) == list(export_chunks(export_format, simplify=0.01))
+
+@pytest.mark.django_db
+def test_export_is_streamed_asynchronously_under_asgi(setup_districts):
+    sync_meteo_warnings([create_event_with_params(valid_to_delta=-timedelta(days=1), teryt=["3021"])])
+
+    async def read_export():
+        response = await AsyncClient().get(reverse("meteo_warnings_export"))
+        assert response.is_async
+        chunks = aiter(response.streaming_content)
+        header = await anext(chunks)
+        return header, header + b"".join([chunk async for chunk in chunks])
+
+    # async_to_sync runs thread sensitive queries in this thread, inside test transaction
+    header, body = async_to_sync(read_export)()
+    assert header == b'{"type": "FeatureCollection", "features": [\n'
+    assert [f["properties"]["district_code"] for f in json.loads(body)["features"]] == ["3021"]
+
+@pytest.mark.django_db
+def test_archive_api_pages_through_warnings_with_cursor(setup_districts):
+    for i in range(3):
+        archived = MeteoWarningArchive.objects.create(id="archived-{}".format(i), name_of_event="Storm", grade="2",
+                                                      probability="80", valid_to=timezone.now() - timedelta(days=i))
+        archived.districts.add("3021", through_defaults={"valid_to": archived.valid_to})
+    client = APIClient()
+    first = client.get(reverse("meteo_warnings_archive"), {"district": "3021", "limit": 2}).json()
+    assert [warning["id"] for warning in first["results"]] == ["archived-0", "archived-1"]
+    assert first["results"][0]["districts"] == ["3021"]
+    second = client.get(reverse("meteo_warnings_archive"), {"district": "3021", "limit": 2, "cursor": first["next"]}).json()
+    assert [warning["id"] for warning in second["results"]] == ["archived-2"]
+    assert second["next"] is None
+
+@pytest.mark.django_db
+def test_archive_partitions_are_created_and_detached(setup_districts):
+    old = MeteoWarning.objects.create(id="old", name_of_event="Storm", grade="2", probability="80",
+                                      valid_to=datetime(2024, 5, 10, tzinfo=dt_timezone.utc))
+    old.districts.add("3021")
+    archive_expired_warnings()
+    created = create_archive_partitions(now=datetime(2024, 6, 1, tzinfo=dt_timezone.utc), months_ahead=1)
+    assert "satagro_meteowarningarchive_p202405" in created
+    assert "satagro_meteowarningarchive_districts_p202407" in created
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM satagro_meteowarningarchive_p202405")
+        assert cursor.fetchone()[0] == 1
+    assert list(MeteoWarningArchive.objects.get(id=old.id).districts.values_list("district_code", flat=True)) == ["3021"]
+    detached = detach_archive_partitions(datetime(2024, 6, 1, tzinfo=dt_timezone.utc), drop=True)
+    assert detached == ["satagro_meteowarningarchive_districts_p202405", "satagro_meteowarningarchive_p202405"]
+    assert not MeteoWarningArchive.objects.exists()
+
+@pytest.mark.django_db
+def test_fast_json_response_is_identical_to_serializer_response(setup_districts, settings):
+    event = create_event_with_params(id="fast", teryt=["3021"], valid_to_delta=timedelta(days=-1),
+                                     tresc="Burze z gradem — możliwe\u2028porywy")
+    sync_meteo_warnings([event])
+    params = {"lat": 52.559973222669726, "lon": 16.43304832145737}
+    settings.METEO_WARNINGS_CACHE_ENABLED = False
+    settings.DISTRICT_SNAPSHOTS_ENABLED = False
+    client = APIClient()
+    settings.FAST_JSON_VIEWS = []
+    drf = client.get(reverse("meteo_warnings"), params)
+    settings.FAST_JSON_VIEWS = ["meteo_warnings"]
+    fast = client.get(reverse("meteo_warnings"), params)
+    assert fast.content == drf.content
+    assert fast["ETag"] == drf["ETag"]
+    assert fast["Content-Type"] == drf["Content-Type"]
+
+@pytest.mark.django_db
+def test_meteo_warnings_answers_conditional_request_without_snapshot(setup_districts, settings):
+    sync_meteo_warnings([create_event_with_params(id="conditional", teryt=["3021"], valid_to_delta=-timedelta(days=1))])
+    settings.DISTRICT_SNAPSHOTS_ENABLED = False
+    params = {"lat": 52.56698693108296, "lon": 17.008185553339786}
+    client = APIClient()
+    response = client.get(reverse("meteo_warnings"), params)
+    assert response.status_code == 200
+    assert response.has_header("Last-Modified")
+    revalidated = client.get(reverse("meteo_warnings"), params, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert revalidated.status_code == 304
+    assert revalidated["Last-Modified"] == response["Last-Modified"]
+
+@pytest.mark.django_db
+def test_nearest_district_fallback_flags_response_as_approximate(setup_districts):
+    district = min(District.objects.all(), key=lambda district: district.geom.extent[0])
+    lon, lat = min((coord for polygon in district.geom for coord in polygon[0].coords), key=lambda coord: coord[0])
+    params = {"lon": lon - 0.002, "lat": lat}
+    client = APIClient()
+    assert client.get(reverse("meteo_warnings"), params).status_code == 404
+    assert client.get(reverse("meteo_warnings"), dict(params, tolerance=20)).status_code == 404
+    response = client.get(reverse("meteo_warnings"), dict(params, tolerance=1000))
+    assert response.status_code == 200
+    assert response.json()["district_code"] == district.district_code
+    assert response.json()["approximate"] is True
+    assert 20 < response.json()["distance"] < 1000
+    assert response["ETag"].endswith('-approximate"')
+
+@pytest.mark.django_db
+def test_generate_districts_builds_voivodeships_and_country_envelope(setup_districts):
+    assert Voivodeship.objects.count() == 16
+    reset_district_index()
+    point, _ = create_point(17.008185553339786, 52.56698693108296)
+    assert in_country_envelope(point)
+    assert not in_country_envelope(create_point(0, 0)[0])
+    assert get_district_index().lookup(point) == "3021"
+
+@pytest.mark.django_db
+def test_geocode_chunks_joins_live_and_archived_warnings_by_time(setup_districts):
+    now = timezone.now()
+    live = MeteoWarning.objects.create(id="live", name_of_event="Storm", grade="2", probability="80",
+                                       valid_from=now - timedelta(hours=1), valid_to=now + timedelta(hours=5))
+    live.districts.add("3021")
+    archived = MeteoWarningArchive.objects.create(id="archived", name_of_event="Storm", grade="2", probability="80",
+                                                  valid_from=now - timedelta(days=3), valid_to=now - timedelta(days=2))
+    archived.districts.add("3021", through_defaults={"valid_to": archived.valid_to})
+    columns = ["lon", "lat", "time"]
+    rows = [["17.008185553339786", "52.56698693108296", now.isoformat()],
+            ["17.008185553339786", "52.56698693108296", (now - timedelta(days=2, hours=12)).isoformat()],
+            ["17.008185553339786", "52.56698693108296", (now - timedelta(days=10)).isoformat()],
+            ["0", "0", now.isoformat()]]
+    result = list(geocode_chunks(columns, iter([rows[:2], rows[2:]]), "lon", "lat", "time", workers=1))
+    assert [row[3:] for row in result] == [["3021", "live"], ["3021", "archived"], ["3021", ""], ["", ""]]
+
+@pytest.mark.django_db
+def test_meteo_warnings_at_time_spans_live_and_archived_warnings(setup_districts, settings):
+    settings.METEO_WARNINGS_CACHE_ENABLED = False
+    now = timezone.now()
+    tonight = MeteoWarning.objects.create(id="tonight", name_of_event="Storm", grade="2", probability="80",
+                                          valid_from=now + timedelta(hours=10), valid_to=now + timedelta(hours=16))
+    tonight.districts.add("3021")
+    archived = MeteoWarningArchive.objects.create(id="archived", name_of_event="Frost", grade="1", probability="80",
+                                                  valid_from=now - timedelta(days=3), valid_to=now - timedelta(days=2))
+    archived.districts.add("3021", through_defaults={"valid_to": archived.valid_to})
+    client = APIClient()
+    params = {"lat": 52.56698693108296, "lon": 17.008185553339786}
+
+    def warning_ids(**time_params):
+        response = client.get(reverse("meteo_warnings"), dict(params, **time_params))
+        assert response.status_code == 200
+        return [warning["id"] for warning in response.json()["warnings"]]
+
+    fmt = "%Y-%m-%d %H:%M:%S"
+    assert warning_ids(at=timezone.localtime(now + timedelta(hours=12)).strftime(fmt)) == ["tonight"]
+    assert warning_ids(at=timezone.localtime(now - timedelta(days=2, hours=12)).strftime(fmt)) == ["archived"]
+    assert warning_ids(**{"from": timezone.localtime(now - timedelta(days=5)).strftime(fmt),
+                          "to": timezone.localtime(now + timedelta(days=1)).strftime(fmt)}) == ["archived", "tonight"]
+    assert warning_ids() == ["tonight"]
+
+
+@pytest.mark.parametrize("policy, runs", [(SKIP, 1), (COALESCE, 2)])
+def test_singleton_task_skips_or_coalesces_overlapping_runs(policy, runs):
+    calls = []
+
+    @singleton_task("test_singleton_{}".format(policy), policy=policy)
+    def task():
+        calls.append(policy)
+        if len(calls) == 1:
+            # triggers arriving while the first run holds the lock
+            assert task() is None
+            assert task() is None
+        return len(calls)
+
+    assert task() == runs
+    assert task() == runs + 1
+
+
+@pytest.mark.django_db
+def test_archive_timers_archive_warnings_at_their_valid_to(setup_districts):
+    get_client().delete(TIMERS_KEY)
+    fmt = "%Y-%m-%d %H:%M:%S"
+    now = timezone.localtime()
+    expired = create_event_with_params(id="expired", obowiazuje_do=(now - timedelta(minutes=1)).strftime(fmt))
+    extended = create_event_with_params(id="extended", obowiazuje_do=(now - timedelta(minutes=1)).strftime(fmt))
+    result = sync_meteo_warnings([expired, extended])
+    assert set(result.valid_to) == {"expired", "extended"}
+    schedule_archiving(result.valid_to)
+
+    # update moving valid_to of warning to future moves its timer as well
+    extended["obowiazuje_do"] = (now + timedelta(hours=1)).strftime(fmt)
+    schedule_archiving(sync_meteo_warnings([extended]).valid_to)
+    # timer of warning archived meanwhile by the hourly scan
+    schedule_archiving({"gone": now - timedelta(hours=1)})
+
+    assert archive_due_meteo_warnings() == 1
+    assert list(MeteoWarningArchive.objects.values_list("id", flat=True)) == ["expired"]
+    assert list(MeteoWarning.objects.values_list("id", flat=True)) == ["extended"]
+    assert get_client().zrange(TIMERS_KEY, 0, -1) == ["extended"]
+
+
+@pytest.mark.django_db
+def test_swap_districts_updates_geometry_and_remaps_warnings_of_removed_district(setup_districts):
+    warning = MeteoWarning.objects.create(id="remapped", name_of_event="Storm", grade="1", probability="80",
+                                          valid_to=timezone.now() + timedelta(days=1))
+    warning.districts.add("3021")
+    districts = {district.district_code: district for district in District.objects.all()}
+    # 3021 is replaced by 3099 with the same area, 3064 gets a new name
+    districts["3099"] = districts.pop("3021")
+    districts["3099"].district_code = "3099"
+    districts["3064"].name = "Poznań (new)"
+
+    result = swap_districts(list(districts.values()))
+
+    assert (result.created, result.updated, result.removed) == (["3099"], ["3064"], ["3021"])
+    assert result.remapped == {"3021": ["3099"]}
+    assert list(warning.districts.values_list("district_code", flat=True)) == ["3099"]
+    assert not District.objects.filter(district_code="3021").exists()
+    assert DistrictPart.objects.filter(district_id="3099").exists()
+    assert District.objects.get(district_code="3064").name == "Poznań (new)"
+    assert District.objects.count() == len(districts)
+
+
+@pytest.mark.django_db
+def test_meteo_warnings_stream_sends_published_district_changes(setup_districts):
+    async def read_events():
+        response = await AsyncClient().get(reverse("meteo_warnings_stream"), {"districts": "3021"})
+        assert response.status_code == 200
+        events = aiter(response.streaming_content)
+        subscribed = await anext(events)
+        broadcaster._dispatch(CHANNEL_PREFIX + "3021", json.dumps(
+            {"event": "updated", "data": {"district_code": "3021", "warnings": []}}))
+        event = await asyncio.wait_for(anext(events), timeout=5)
+        await events.aclose()
+        return subscribed, event
+
+    subscribed, event = asyncio.run(read_events())
+    assert subscribed == b": subscribed to 3021\n\n"
+    assert event.decode() == 'event: updated\ndata: {"district_code": "3021", "warnings": []}\n\n'
+
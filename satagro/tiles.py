@@ -0,0 +1,119 @@
+import hashlib
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from satagro.cache import get_districts_version, get_warnings_generation
+from satagro.district_index import extent_in_country_envelope
+from satagro.models import District, MeteoWarning
+from satagro.snapshots import get_district_snapshots, snapshot_validators
+
+logger = logging.getLogger(__name__)
+
+TILE_EXTENT = 4096
+
+
+def tile_is_valid(z, x, y):
+    """Check if tile coordinates exist in Web Mercator tile pyramid"""
+    return 0 <= z <= settings.TILES_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def simplify_tolerance(z):
+    """Simplification tolerance in degrees, TILES_SIMPLIFY_PIXELS pixels of tile at zoom level z"""
+    return 360 / 2 ** z / TILE_EXTENT * settings.TILES_SIMPLIFY_PIXELS
+
+
+def tile_extent(z, x, y):
+    """Extent (xmin, ymin, xmax, ymax) of tile in degrees"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def tile_district_codes(z, x, y, districts_version):
+    """Return codes of districts overlapping tile, tiles outside of the country are not queried nor cached"""
+    if not extent_in_country_envelope(tile_extent(z, x, y)):
+        return []
+    key = "satagro:tile_districts:{}:{}:{}:{}".format(districts_version, z, x, y)
+    codes = cache.get(key)
+    if codes is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT district_code FROM {} WHERE geom && ST_Transform(ST_TileEnvelope(%s, %s, %s), 4326) "
+                "ORDER BY district_code".format(connection.ops.quote_name(District._meta.db_table)),
+                [z, x, y])
+            codes = [row[0] for row in cursor.fetchall()]
+        # key space grows with zoom level, so lists expire like tiles instead of staying for good
+        cache.set(key, codes, timeout=settings.TILES_CACHE_TIMEOUT)
+    return codes
+
+
+def tile_etag(z, x, y, districts_version, district_codes):
+    """ETag of tile, it changes only when warnings of districts in tile change"""
+    snapshots = get_district_snapshots(district_codes)
+    if len(snapshots) == len(district_codes):
+        versions = [snapshot_validators(snapshots[code])[0] for code in district_codes]
+    else:
+        versions = ["generation-{}".format(get_warnings_generation())]
+    digest = hashlib.sha1("{}/{}/{}|{}|{}".format(z, x, y, districts_version, ",".join(versions)).encode())
+    return '"{}"'.format(digest.hexdigest())
+
+
+def render_tile(z, x, y):
+    """Render Mapbox Vector Tile of districts with attributes of their active warnings"""
+    qn = connection.ops.quote_name
+    districts_m2m = MeteoWarning._meta.get_field("districts")
+    sql = """
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+        ),
+        active AS (
+            SELECT l.{district_fk} AS district_code,
+                   max(w.grade) AS max_grade,
+                   string_agg(DISTINCT w.name_of_event, ', ') AS events,
+                   count(*) AS warnings
+            FROM {links} l JOIN {warnings} w ON w.id = l.{warning_fk}
+            WHERE w.valid_to >= now()
+            GROUP BY l.{district_fk}
+        ),
+        features AS (
+            SELECT ST_AsMVTGeom(ST_Transform(ST_SimplifyPreserveTopology(d.geom, %(tolerance)s), 3857),
+                                bounds.geom, %(extent)s, 64, true) AS geom,
+                   d.district_code, d.name, a.max_grade, a.events, coalesce(a.warnings, 0) AS warnings
+            FROM {districts} d
+            JOIN bounds ON d.geom && ST_Transform(bounds.geom, 4326)
+            LEFT JOIN active a ON a.district_code = d.district_code
+        )
+        SELECT ST_AsMVT(features, 'districts', %(extent)s, 'geom') FROM features WHERE geom IS NOT NULL
+    """.format(
+        districts=qn(District._meta.db_table),
+        warnings=qn(MeteoWarning._meta.db_table),
+        links=qn(districts_m2m.m2m_db_table()),
+        warning_fk=qn(districts_m2m.m2m_column_name()),
+        district_fk=qn(districts_m2m.m2m_reverse_name()),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"z": z, "x": x, "y": y, "tolerance": simplify_tolerance(z), "extent": TILE_EXTENT})
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b""
+
+
+def get_tile(z, x, y):
+    """Return (tile bytes, ETag), tiles are cached until warnings of districts in tile change"""
+    districts_version = get_districts_version()
+    district_codes = tile_district_codes(z, x, y, districts_version)
+    etag = tile_etag(z, x, y, districts_version, district_codes)
+    if not district_codes:
+        return b"", etag
+    key = "satagro:tile:{}".format(etag.strip('"'))
+    tile = cache.get(key)
+    if tile is None:
+        tile = render_tile(z, x, y)
+        cache.set(key, tile, timeout=settings.TILES_CACHE_TIMEOUT)
+    return tile, etag
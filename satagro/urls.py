@@ -1,7 +1,13 @@
 from django.urls import path
 
-from satagro.api.views import MeteoWarningsApiView
+from satagro.api.views import (MeteoWarningsApiView, MeteoWarningsArchiveApiView, MeteoWarningsBatchApiView,
+                               district_tiles, meteo_warnings_export, meteo_warnings_stream)
 
 urlpatterns = [
     path('meteo_warnings/', MeteoWarningsApiView.as_view(), name='meteo_warnings'),
+    path('meteo_warnings/batch/', MeteoWarningsBatchApiView.as_view(), name='meteo_warnings_batch'),
+    path('meteo_warnings/stream/', meteo_warnings_stream, name='meteo_warnings_stream'),
+    path('meteo_warnings/export/', meteo_warnings_export, name='meteo_warnings_export'),
+    path('meteo_warnings/archive/', MeteoWarningsArchiveApiView.as_view(), name='meteo_warnings_archive'),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', district_tiles, name='district_tiles'),
 ]